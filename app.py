@@ -6,11 +6,13 @@ Created on Tue Dec 30 14:39:34 2025
 """
 
 import os
+import queue
+import shutil
+import tempfile
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
-from pypdf import PdfReader, PdfWriter
-import io
 from datetime import datetime
 
 class SimplePDFSplitter:
@@ -28,6 +30,7 @@ class SimplePDFSplitter:
         
         # Variables
         self.input_file = ""
+        self.input_files = []  # modo lote
         self.output_dir = ""
         self.max_size_mb = 4.0
         
@@ -91,6 +94,19 @@ class SimplePDFSplitter:
                                    command=self.select_file)
         self.select_btn.pack(fill=tk.X)
         
+        # Modo lote: varios PDF en un solo ZIP
+        self.batch_btn = tk.Button(select_frame,
+                                  text="📚 O selecciona varios PDF (lote)",
+                                  font=("Arial", 10),
+                                  bg="#6c757d",
+                                  fg="white",
+                                  relief="flat",
+                                  padx=15,
+                                  pady=8,
+                                  cursor="hand2",
+                                  command=self.select_files)
+        self.batch_btn.pack(fill=tk.X, pady=(8, 0))
+        
         # Info del archivo
         self.file_label = tk.Label(select_frame,
                                   text="No hay archivo seleccionado",
@@ -208,10 +224,28 @@ class SimplePDFSplitter:
         
         if filename:
             self.input_file = filename
+            self.input_files = []
             self.update_file_info()
             self.split_btn.config(state=tk.NORMAL, bg=self.success_color)
             self.log(f"✅ Seleccionado: {os.path.basename(filename)}")
     
+    def select_files(self):
+        """Abre el explorador para seleccionar varios PDF (modo lote)"""
+        filenames = filedialog.askopenfilenames(
+            title="Selecciona los archivos PDF del lote",
+            filetypes=[("Archivos PDF", "*.pdf")]
+        )
+        
+        if filenames:
+            self.input_files = list(filenames)
+            self.input_file = ""
+            total_size = sum(os.path.getsize(path) for path in self.input_files) / (1024 * 1024)
+            self.file_label.config(text=f"📚 {len(self.input_files)} archivos\n"
+                                        f"📦 Tamaño total: {total_size:.2f} MB",
+                                   fg=self.primary_color)
+            self.split_btn.config(state=tk.NORMAL, bg=self.success_color)
+            self.log(f"✅ Lote de {len(self.input_files)} archivos seleccionado")
+    
     def select_output_dir(self):
         """Abre el explorador para seleccionar carpeta de destino"""
         directory = filedialog.askdirectory(
@@ -229,17 +263,25 @@ class SimplePDFSplitter:
             return
         
         try:
+            from pdf_logic import analyze_pdf, parse_max_size
+            
             # Obtener información básica
             file_size = os.path.getsize(self.input_file) / (1024 * 1024)
             
-            # Leer PDF
-            reader = PdfReader(self.input_file)
-            page_count = len(reader.pages)
+            # Solo se planifica la división, sin escribir ni calibrar con la
+            # primera parte: corre en el hilo de la interfaz y no debe bloquearla
+            try:
+                max_size = parse_max_size(self.size_var.get())
+            except ValueError:
+                max_size = None
+            analysis = analyze_pdf(self.input_file, max_size, calibrate=False)
             
             # Actualizar label
             info_text = (f"📄 {os.path.basename(self.input_file)}\n"
                         f"📦 Tamaño: {file_size:.2f} MB\n"
-                        f"📄 Páginas: {page_count}")
+                        f"📄 Páginas: {analysis['pages']}")
+            if analysis['parts']:
+                info_text += f"\n✂️ Partes estimadas: {len(analysis['parts'])} de {max_size:g} MB"
             
             self.file_label.config(text=info_text)
             
@@ -257,131 +299,184 @@ class SimplePDFSplitter:
             self.log(f"❌ Error: {str(e)}")
     
     def start_split(self):
-        """Inicia el proceso de división"""
-        if not self.input_file:
+        """Inicia la división en un hilo de trabajo"""
+        if not self.input_file and not self.input_files:
             return
         
         try:
             # Obtener configuración
             self.max_size_mb = float(self.size_var.get())
-            
-            if self.max_size_mb <= 0:
-                messagebox.showerror("Error", "El tamaño debe ser mayor a 0")
-                return
-            
-            # Deshabilitar botones
-            self.split_btn.config(state=tk.DISABLED, text="PROCESANDO...")
-            self.select_btn.config(state=tk.DISABLED)
-            
-            # Realizar división
-            self.root.after(100, self.perform_split)
-            
         except ValueError:
             messagebox.showerror("Error", "Tamaño inválido")
-            self.split_btn.config(state=tk.NORMAL, text="🚀 INICIAR DIVISIÓN")
+            return
+        
+        if self.max_size_mb <= 0:
+            messagebox.showerror("Error", "El tamaño debe ser mayor a 0")
+            return
+        
+        # Deshabilitar selección; el botón principal pasa a cancelar
+        self.split_btn.config(text="⏹ CANCELAR", bg="#dc3545", command=self.cancel_split)
+        self.select_btn.config(state=tk.DISABLED)
+        self.batch_btn.config(state=tk.DISABLED)
+        
+        # El hilo de trabajo no toca la interfaz: solo deja eventos en la
+        # cola, que poll_events vacía desde el bucle de Tk
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.progress_shown = False
+        if self.input_files:
+            args = (list(self.input_files), self.output_dir, self.max_size_mb)
+            worker = self.batch_worker
+        else:
+            args = (self.input_file, self.output_dir, self.max_size_mb)
+            worker = self.split_worker
+        threading.Thread(target=worker, args=args, daemon=True).start()
+        self.root.after(100, self.poll_events)
+    
+    def cancel_split(self):
+        """Pide al hilo de trabajo que se detenga"""
+        self.cancel_event.set()
+        self.split_btn.config(state=tk.DISABLED, text="CANCELANDO...")
     
-    def perform_split(self):
-        """Realiza la división del PDF"""
+    def split_worker(self, input_file, output_dir, max_size_mb):
+        """Divide un PDF con el motor de pdf_logic (hilo de trabajo)"""
+        from pdf_logic import iter_split_pdf, SplitCancelled
+        
+        events = self.events
+        output_folder = None
         try:
-            self.log("\n" + "="*50)
-            self.log("INICIANDO DIVISIÓN")
-            self.log("="*50)
+            events.put(('log', "\n" + "="*50))
+            events.put(('log', "INICIANDO DIVISIÓN"))
+            events.put(('log', "="*50))
             
             # Determinar base de la carpeta destino
-            input_dir = self.output_dir if self.output_dir else os.path.dirname(self.input_file)
-            base_name = os.path.splitext(os.path.basename(self.input_file))[0]
+            input_dir = output_dir if output_dir else os.path.dirname(input_file)
+            base_name = os.path.splitext(os.path.basename(input_file))[0]
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             folder_name = f"{base_name}_partes_{timestamp}"
             output_folder = os.path.join(input_dir, folder_name)
             
             if os.path.exists(output_folder):
-                import shutil
                 shutil.rmtree(output_folder)
             
             os.makedirs(output_folder)
             
-            self.log(f"📁 Creando carpeta: {output_folder}")
+            events.put(('log', f"📁 Creando carpeta: {output_folder}"))
             
-            # Leer PDF
-            reader = PdfReader(self.input_file)
-            total_pages = len(reader.pages)
+            last_progress = [None]
             
-            # Dividir PDF
-            max_size_bytes = self.max_size_mb * 1024 * 1024
-            safety_factor = 0.9
+            def update_progress(progress):
+                if progress != last_progress[0]:
+                    last_progress[0] = progress
+                    events.put(('progress', f"{progress}%"))
             
-            parts = []
-            current_writer = PdfWriter()
-            current_pages = []
-            current_size = 0
-            part_num = 1
+            stats = {}
+            part_num = 0
+            for filename, content in iter_split_pdf(input_file, max_size_mb,
+                                                    progress_callback=update_progress,
+                                                    stats=stats,
+                                                    cancelled=self.cancel_event.is_set):
+                with open(os.path.join(output_folder, f"{base_name}_{filename}"), 'wb') as f:
+                    f.write(content)
+                part_num += 1
+                first_page, last_page = stats['pages'][-1]
+                events.put(('log', f"✅ Parte {part_num:03d}: "
+                                   f"páginas {first_page}-{last_page}, "
+                                   f"{len(content) / (1024 * 1024):.2f} MB"))
             
-            for page_idx in range(total_pages):
-                # Calcular tamaño de página
-                temp_writer = PdfWriter()
-                temp_writer.add_page(reader.pages[page_idx])
-                
-                buffer = io.BytesIO()
-                temp_writer.write(buffer)
-                page_size = len(buffer.getvalue())
-                
-                # Verificar límite
-                if (current_size + page_size > max_size_bytes * safety_factor 
-                    and current_pages):
-                    # Guardar parte
-                    self.save_part(current_writer, current_pages, 
-                                 output_folder, base_name, part_num)
-                    parts.append((current_pages, current_size))
-                    
-                    # Reiniciar
-                    current_writer = PdfWriter()
-                    current_pages = []
-                    current_size = 0
-                    part_num += 1
-                
-                # Agregar página
-                current_writer.add_page(reader.pages[page_idx])
-                current_pages.append(page_idx)
-                current_size += page_size
-                
-                # Actualizar log
-                progress = (page_idx + 1) / total_pages * 100
-                self.log(f"📊 Progreso: {progress:.1f}%", update=True)
+            events.put(('done', output_folder, part_num, f"¡PDF dividido en {part_num} partes!"))
+            
+        except SplitCancelled:
+            if output_folder:
+                shutil.rmtree(output_folder, ignore_errors=True)
+            events.put(('cancelled',))
+        except Exception as e:
+            events.put(('error', str(e)))
+    
+    def batch_worker(self, input_files, output_dir, max_size_mb):
+        """Divide varios PDF en paralelo (un proceso por archivo) y los guarda en un solo ZIP"""
+        from pdf_logic import SplitCancelled
+        from batch import split_batch, write_archive
+        
+        events = self.events
+        try:
+            events.put(('log', "\n" + "="*50))
+            events.put(('log', f"INICIANDO LOTE DE {len(input_files)} ARCHIVOS"))
+            events.put(('log', "="*50))
+            
+            output_dir = output_dir if output_dir else os.path.dirname(input_files[0])
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            archive_path = os.path.join(output_dir, f"lote_partes_{timestamp}.zip")
+            files = [(os.path.basename(path), path) for path in input_files]
             
-            # Guardar última parte
-            if current_pages:
-                self.save_part(current_writer, current_pages, 
-                             output_folder, base_name, part_num)
+            def update_progress(results, overall):
+                done = sum(1 for result in results if result['status'] in ('completed', 'error'))
+                events.put(('progress', f"{overall}% ({done}/{len(results)} archivos)"))
             
-            # Mostrar resumen
-            self.show_summary(output_folder, part_num)
+            with tempfile.TemporaryDirectory() as parts_dir:
+                results = split_batch(files, parts_dir, max_size_mb,
+                                      progress_callback=update_progress,
+                                      cancelled=self.cancel_event.is_set)
+                write_archive(parts_dir, results, archive_path)
             
-            # Habilitar botones
-            self.split_btn.config(state=tk.NORMAL, text="🚀 INICIAR DIVISIÓN")
-            self.select_btn.config(state=tk.NORMAL)
+            for result in results:
+                if result['error']:
+                    events.put(('log', f"❌ {result['name']}: {result['error']}"))
+                else:
+                    events.put(('log', f"✅ {result['name']}: {len(result['parts'])} partes"))
+            events.put(('log', f"📦 Archivo: {os.path.basename(archive_path)}"))
             
-            # Preguntar si abrir carpeta
-            if messagebox.askyesno("Completado", 
-                                 f"¡PDF dividido en {part_num} partes!\n\n"
-                                 f"¿Deseas abrir la carpeta destino?"):
-                self.open_folder(output_folder)
+            total_parts = sum(len(result['parts']) for result in results)
+            events.put(('done', output_dir, total_parts,
+                        f"¡{len(files)} PDF divididos en {total_parts} partes!"))
             
+        except SplitCancelled:
+            events.put(('cancelled',))
         except Exception as e:
-            self.log(f"❌ Error: {str(e)}")
-            self.split_btn.config(state=tk.NORMAL, text="🚀 INICIAR DIVISIÓN")
-            self.select_btn.config(state=tk.NORMAL)
+            events.put(('error', str(e)))
     
-    def save_part(self, writer, page_indices, output_folder, base_name, part_num):
-        """Guarda una parte del PDF"""
-        output_file = os.path.join(output_folder, f"{base_name}_parte_{part_num:03d}.pdf")
-        
-        with open(output_file, 'wb') as f:
-            writer.write(f)
+    def poll_events(self):
+        """Aplica en la interfaz los eventos del hilo de trabajo"""
+        try:
+            while True:
+                event = self.events.get_nowait()
+                kind = event[0]
+                
+                if kind == 'log':
+                    self.log(event[1])
+                    self.progress_shown = False
+                elif kind == 'progress':
+                    # Una sola línea de progreso, reescrita en cada evento
+                    self.log(f"📊 Progreso: {event[1]}", update=self.progress_shown)
+                    self.progress_shown = True
+                elif kind == 'done':
+                    _, output_folder, total_parts, message = event
+                    self.show_summary(output_folder, total_parts)
+                    self.finish_split()
+                    if messagebox.askyesno("Completado",
+                                         f"{message}\n\n"
+                                         f"¿Deseas abrir la carpeta destino?"):
+                        self.open_folder(output_folder)
+                    return
+                elif kind == 'cancelled':
+                    self.log("⏹ División cancelada")
+                    self.finish_split()
+                    return
+                elif kind == 'error':
+                    self.log(f"❌ Error: {event[1]}")
+                    self.finish_split()
+                    return
+        except queue.Empty:
+            pass
         
-        size_mb = os.path.getsize(output_file) / (1024 * 1024)
-        self.log(f"✅ Parte {part_num:03d}: "
-                f"páginas {page_indices[0]+1}-{page_indices[-1]+1}, "
-                f"{size_mb:.2f} MB")
+        self.root.after(100, self.poll_events)
+    
+    def finish_split(self):
+        """Rehabilita los botones al terminar"""
+        self.split_btn.config(state=tk.NORMAL, text="🚀 INICIAR DIVISIÓN",
+                              bg=self.success_color, command=self.start_split)
+        self.select_btn.config(state=tk.NORMAL)
+        self.batch_btn.config(state=tk.NORMAL)
     
     def show_summary(self, output_folder, total_parts):
         """Muestra resumen del proceso"""
@@ -413,7 +508,6 @@ class SimplePDFSplitter:
         timestamp = datetime.now().strftime("%H:%M:%S")
         self.message_text.insert(tk.END, f"[{timestamp}] {message}\n")
         self.message_text.see(tk.END)
-        self.root.update()
     
     def run(self):
         """Ejecuta la aplicación"""
@@ -423,7 +517,7 @@ class SimplePDFSplitter:
 def check_dependencies():
     """Verifica e instala dependencias necesarias"""
     try:
-        from pypdf import PdfReader
+        import fitz
         return True
     except ImportError:
         print("🔧 Instalando dependencias necesarias...")
@@ -431,12 +525,12 @@ def check_dependencies():
         import sys
         
         try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "pypdf"])
+            subprocess.check_call([sys.executable, "-m", "pip", "install", "pymupdf"])
             print("✅ Dependencias instaladas correctamente")
             return True
         except:
             print("❌ Error al instalar dependencias")
-            print("Por favor instala manualmente: pip install pypdf")
+            print("Por favor instala manualmente: pip install pymupdf")
             return False
 
 def main():
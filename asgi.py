@@ -0,0 +1,368 @@
+"""
+ASGI front end: the transfer-bound routes of server.py on asyncio, so a
+slow client holds a coroutine instead of one of a few WSGI threads.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+
+Uploads (/upload, /batch, /analyze and the chunks of resumable uploads),
+downloads (/download/<job_id>, /jobs/<job_id>/parts/<n>) and progress
+streams are served here, with their disk I/O handed to the thread pool a
+piece at a time. Every other route is the Flask app itself, mounted as WSGI. Splits
+still run on the server's JobScheduler threads, sharing its store, cache
+and metrics.
+"""
+import io
+import json
+import contextlib
+import time
+import uuid
+import asyncio
+
+from a2wsgi import WSGIMiddleware
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags
+
+import metrics
+import server
+from server import app as flask_app, store, uploads
+
+# Request body buffered between two writes to disk
+_WRITE_SIZE = 1024 * 1024
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+class UploadedFile:
+    """A file field of a streamed form: its filename and HashingSpoolFile."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stream = None
+
+
+class FormReader:
+    """
+    multipart/form-data parsed as the body arrives. File fields go straight
+    into HashingSpoolFiles in UPLOAD_FOLDER, hashed on the way as with
+    Flask's UploadRequest; other fields are kept as text (first value wins).
+    feed() only parses: the file data it produces is written by flush(),
+    which callers run in the thread pool.
+    """
+
+    def __init__(self, boundary):
+        self.fields = {}
+        self.files = []  # (field name, UploadedFile)
+        self.pending = 0
+        self._writes = []
+        self._header_field = b''
+        self._header_value = b''
+        self._disposition = b''
+        self._name = ''
+        self._file = None
+        self._value = b''
+        self._parser = MultipartParser(boundary, callbacks={
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._disposition = b''
+        self._file = None
+        self._value = b''
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_field.lower() == b'content-disposition':
+            self._disposition = self._header_value
+        self._header_field = b''
+        self._header_value = b''
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._disposition)
+        self._name = params.get(b'name', b'').decode('utf-8', 'replace')
+        if b'filename' in params:
+            self._file = UploadedFile(params[b'filename'].decode('utf-8', 'replace'))
+            self.files.append((self._name, self._file))
+
+    def _on_part_data(self, data, start, end):
+        if self._file is not None:
+            self._writes.append((self._file, data[start:end]))
+            self.pending += end - start
+        else:
+            self._value += data[start:end]
+
+    def _on_part_end(self):
+        if self._file is None:
+            self.fields.setdefault(self._name, self._value.decode('utf-8', 'replace'))
+
+    def feed(self, chunk):
+        self._parser.write(chunk)
+
+    def finish(self):
+        self._parser.finalize()
+
+    def flush(self):
+        """Write the file data parsed so far; every file field gets its spool."""
+        for _, file in self.files:
+            if file.stream is None:
+                file.stream = server.HashingSpoolFile(server.scratch.spool_path(uuid.uuid4().hex))
+        for file, data in self._writes:
+            file.stream.write(data)
+        self._writes = []
+        self.pending = 0
+
+    def discard(self):
+        server._discard_spools([file for _, file in self.files if file.stream is not None])
+
+
+async def _read_form(request):
+    """
+    Stream a multipart/form-data request into a FormReader. Raises
+    BodyTooLarge over MAX_CONTENT_LENGTH and ValueError for anything else
+    that is not a complete form.
+    """
+    content_type, params = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or not params.get(b'boundary'):
+        raise ValueError("Se esperaba un formulario multipart/form-data")
+    limit = flask_app.config['MAX_CONTENT_LENGTH']
+    if int(request.headers.get('content-length') or 0) > limit:
+        raise BodyTooLarge("Archivo demasiado grande")
+
+    form = FormReader(params[b'boundary'])
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise BodyTooLarge("Archivo demasiado grande")
+            form.feed(chunk)
+            if form.pending >= _WRITE_SIZE:
+                await run_in_threadpool(form.flush)
+        form.finish()
+        await run_in_threadpool(form.flush)
+    except ClientDisconnect:
+        form.discard()
+        raise ValueError("Subida interrumpida")
+    except BaseException:
+        form.discard()
+        raise
+    return form
+
+
+def _admitted(handler):
+    """Answer 507 instead of receiving a multipart upload the scratch area has no room for."""
+    async def admitted(request):
+        if not request.headers.get('content-type', '').startswith('multipart/form-data'):
+            return await handler(request)
+        nbytes = server._upload_reservation(request.headers.get('content-length'))
+        if not await run_in_threadpool(server._reserve_scratch, nbytes):
+            body, status, headers = server._scratch_full()
+            return JSONResponse(body, status, headers)
+        try:
+            return await handler(request)
+        finally:
+            server.scratch.release(nbytes)
+    return admitted
+
+
+def _form_error(error):
+    return JSONResponse({"error": str(error)}, 413 if isinstance(error, BodyTooLarge) else 400)
+
+
+async def upload(request):
+    try:
+        form = await _read_form(request)
+    except ValueError as e:
+        return _form_error(e)
+
+    try:
+        files = [file for name, file in form.files if name == 'pdf_file']
+        if not files:
+            return JSONResponse({"error": "No hay archivo"}, 400)
+        if files[0].filename == '':
+            return JSONResponse({"error": "No se ha seleccionado archivo"}, 400)
+        body, status = await run_in_threadpool(server._accept_upload, files[0].filename,
+                                               files[0].stream, form.fields)
+        return JSONResponse(body, status)
+    finally:
+        await run_in_threadpool(form.discard)
+
+
+async def batch(request):
+    try:
+        form = await _read_form(request)
+    except ValueError as e:
+        return _form_error(e)
+
+    try:
+        files = [file for name, file in form.files if name == 'pdf_files' and file.filename]
+        # Moving and unzipping the files is blocking work
+        body, status, headers = await run_in_threadpool(server._start_batch, files, form.fields)
+        return JSONResponse(body, status, headers)
+    finally:
+        await run_in_threadpool(form.discard)
+
+
+async def analyze(request):
+    if request.headers.get('content-type', '').startswith('application/json'):
+        try:
+            data = await request.json()
+        except ValueError:
+            return JSONResponse({"error": "JSON no válido"}, 400)
+        body, status = await run_in_threadpool(server._analyze_request, data, None)
+        return JSONResponse(body, status)
+
+    try:
+        form = await _read_form(request)
+    except ValueError as e:
+        return _form_error(e)
+
+    try:
+        files = [file for name, file in form.files if name == 'pdf_file']
+        body, status = await run_in_threadpool(server._analyze_request, form.fields,
+                                               files[0] if files else None)
+        return JSONResponse(body, status)
+    finally:
+        await run_in_threadpool(form.discard)
+
+
+async def upload_chunk(request):
+    upload = uploads.get(request.path_params['upload_id'])
+    if not upload:
+        return JSONResponse({"error": "Subida no encontrada"}, 404)
+
+    async def write(offset, chunks):
+        return await run_in_threadpool(upload.write, offset, io.BytesIO(b''.join(chunks)))
+
+    try:
+        offset = int(request.headers.get('upload-offset', ''))
+        with metrics.span('upload_save'):
+            chunks, size = [], 0
+            async for chunk in request.stream():
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= _WRITE_SIZE:
+                    offset += await write(offset, chunks)
+                    chunks, size = [], 0
+            if chunks:
+                await write(offset, chunks)
+    except ClientDisconnect:
+        # What arrived is kept; the client resumes from upload_status
+        return Response(status_code=400)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, 400)
+    return JSONResponse({"received": upload.received_bytes()})
+
+
+async def progress_stream(request):
+    job_id = request.path_params['job_id']
+    if not await run_in_threadpool(store.get, job_id):
+        return JSONResponse({"error": "Job no encontrado"}, 404)
+
+    interval = flask_app.config['PROGRESS_EVENT_INTERVAL']
+    keepalive = flask_app.config['PROGRESS_KEEPALIVE']
+
+    async def events():
+        last_state = None
+        last_sent = time.time()
+        while True:
+            job = await run_in_threadpool(store.get, job_id)
+            if job is None:
+                yield f"data: {json.dumps({'status': 'error', 'error': 'Job no encontrado'})}\n\n"
+                return
+            payload = server._progress_payload(job_id, job)
+            state = server._progress_state(payload)
+            if state != last_state:
+                last_state = state
+                last_sent = time.time()
+                yield f"data: {json.dumps(payload)}\n\n"
+                if payload['status'] in server._FINAL_STATUSES:
+                    return
+            elif time.time() - last_sent >= keepalive:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            # The job threads cannot wake a coroutine; polling every
+            # interval also coalesces bursts of updates
+            await asyncio.sleep(interval)
+
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def download(request):
+    found = await run_in_threadpool(server._job_archive, request.path_params['job_id'])
+    if found is None:
+        return Response("Archivo no listo o expirado", 404, media_type='text/plain')
+    archive, etag, download_name = found
+
+    requested = server._requested_range(request.headers.get('range'), request.headers.get('if-range'),
+                                        etag, archive.size)
+    if requested is None:
+        return Response(status_code=416, headers={'Content-Range': f"bytes */{archive.size}"})
+    start, stop, status = requested
+
+    headers = {
+        'Content-Length': str(stop - start),
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{etag}"',
+        'Content-Disposition': f'attachment; filename="{download_name}"',
+    }
+    if status == 206:
+        headers['Content-Range'] = f"bytes {start}-{stop - 1}/{archive.size}"
+    # A plain iterator: Starlette reads each chunk in the thread pool
+    return StreamingResponse(server._timed('download', archive.iter_range(start, stop)),
+                             status_code=status, media_type='application/zip', headers=headers)
+
+
+async def job_part(request):
+    found = await run_in_threadpool(server._part_file, request.path_params['job_id'],
+                                    request.path_params['n'])
+    if found is None:
+        return JSONResponse({"error": "Parte no disponible"}, 404)
+    path, part = found
+
+    headers = {}
+    etag = part.get('sha256')
+    if etag:
+        headers['ETag'] = f'"{etag}"'
+        if parse_etags(request.headers.get('if-none-match')).contains(etag):
+            return Response(status_code=304, headers=headers)
+    # FileResponse handles Range and If-Range against these headers
+    return FileResponse(path, media_type='application/pdf', filename=part['name'], headers=headers)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Its own routes never reach Flask's before_request
+    server.start_background()
+    yield
+
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/upload', _admitted(upload), methods=['POST']),
+    Route('/upload/{upload_id}', upload_chunk, methods=['PATCH']),
+    Route('/batch', _admitted(batch), methods=['POST']),
+    Route('/analyze', _admitted(analyze), methods=['POST']),
+    Route('/progress/{job_id}/stream', progress_stream),
+    Route('/download/{job_id}', download),
+    Route('/jobs/{job_id}/parts/{n:int}', job_part),
+    # Everything else is quick: the Flask app, on a2wsgi's thread pool
+    Mount('/', WSGIMiddleware(flask_app)),
+])
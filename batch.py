@@ -0,0 +1,209 @@
+import os
+import queue
+import zlib
+import hashlib
+import itertools
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+import pdf_logic
+from pdf_logic import iter_split_pdf, SplitCancelled
+from zipstream import StoredZip
+
+# Batches run on pdf_logic's process pool: each file is split whole in one
+# process, so a batch scales with the cores instead of with the files.
+# Workers report progress through the pool's message queue; a thread in
+# the parent routes each message to the mailbox of its batch.
+_dispatcher_lock = threading.Lock()
+_dispatching = False
+_mailboxes = {}  # batch token -> queue.Queue
+_tokens = itertools.count()
+
+# Created in the batch's out_dir to cancel it: the pool processes cannot
+# be handed an Event after start-up, but they can all see the file
+_CANCEL_MARKER = '.cancelled'
+
+
+def _dispatch_progress(messages):
+    while True:
+        token, index, progress = messages.get()
+        mailbox = _mailboxes.get(token)
+        if mailbox is not None:
+            mailbox.put((index, progress))
+
+
+def _get_pool(workers):
+    """pdf_logic's shared pool, with the thread routing its progress messages started."""
+    global _dispatching
+    pool = pdf_logic._get_pool(workers)
+    with _dispatcher_lock:
+        if not _dispatching:
+            threading.Thread(target=_dispatch_progress, args=(pdf_logic._pool_messages,),
+                             name="batch-progress", daemon=True).start()
+            _dispatching = True
+    return pool
+
+
+def write_parts(split, stats, out_dir, prefix=None, on_part=None):
+    """
+    Write each (filename, content) that split (an iter_split_pdf started
+    with stats) yields to out_dir, as "<prefix>_<filename>" if prefix is
+    given, and return their manifest entries: name, size, crc32, sha256,
+    first_page and last_page. on_part(entry) is called after each one. If
+    anything fails, the parts written so far are removed before the error
+    propagates.
+    """
+    parts = []
+    try:
+        for filename, content in split:
+            name = f"{prefix}_{filename}" if prefix else filename
+            with open(os.path.join(out_dir, name), 'wb') as out:
+                out.write(content)
+            first_page, last_page = stats['pages'][-1]
+            part = {'name': name, 'size': len(content), 'crc32': zlib.crc32(content),
+                    'sha256': hashlib.sha256(content).hexdigest(),
+                    'first_page': first_page, 'last_page': last_page}
+            parts.append(part)
+            if on_part:
+                on_part(part)
+    except Exception:
+        # Leave no half-split file behind
+        for part in parts:
+            os.remove(os.path.join(out_dir, part['name']))
+        raise
+    return parts
+
+
+def _split_file_worker(token, index, path, out_dir, prefix, max_size_mb, options):
+    """
+    Runs in a pool process: split one file of a batch into out_dir.
+    Returns (parts, recompression report, metrics recorded here).
+    """
+    last = [None]
+
+    def report_progress(progress):
+        if progress != last[0]:
+            last[0] = progress
+            pdf_logic._pool_messages.put((token, index, progress))
+
+    marker = os.path.join(out_dir, _CANCEL_MARKER)
+    stats = {}
+    parts = write_parts(iter_split_pdf(path, max_size_mb, progress_callback=report_progress, stats=stats,
+                                       cancelled=lambda: os.path.exists(marker), **options),
+                        stats, out_dir, prefix)
+    return parts, stats.get('recompressed', []), metrics.drain()
+
+
+def _unique_prefixes(names):
+    prefixes = []
+    seen = set()
+    for name in names:
+        base = os.path.splitext(os.path.basename(name))[0] or "documento"
+        prefix, n = base, 2
+        while prefix in seen:
+            prefix = f"{base}_{n}"
+            n += 1
+        seen.add(prefix)
+        prefixes.append(prefix)
+    return prefixes
+
+
+def split_batch(files, out_dir, max_size_mb, workers=None, progress_callback=None, cancelled=None,
+                **options):
+    """
+    Split every (name, path) of files into out_dir, scheduling the files
+    across the process pool. Parts are named "<file>_parte_NNN.pdf", with
+    the base names made unique within the batch. options are passed on to
+    iter_split_pdf.
+
+    progress_callback(results, overall) is called from the calling thread
+    whenever a file advances; overall (0-100) weighs files by size.
+    Returns one dict per file: name, status ('completed' or 'error'),
+    progress, parts (name, size, crc32, sha256, first_page, last_page), recompressed
+    and error. A file that fails does not stop the others.
+
+    Once cancelled() returns True, files not started are dropped, the running
+    ones stop at their next page or part, and SplitCancelled is raised when
+    they have all stopped; each removes the parts it wrote.
+    """
+    workers = workers or os.cpu_count() or 1
+    pool = _get_pool(workers)
+    token = next(_tokens)
+    mailbox = queue.Queue()
+    _mailboxes[token] = mailbox
+
+    results = [{'name': name, 'status': 'queued', 'progress': 0, 'parts': [],
+                'recompressed': [], 'error': None} for name, _ in files]
+    weights = [max(os.path.getsize(path), 1) for _, path in files]
+    total_weight = sum(weights)
+
+    def overall():
+        # A file that failed is done as far as the batch is concerned
+        done = sum((100 if result['status'] == 'error' else result['progress']) * weight
+                   for result, weight in zip(results, weights))
+        return int(done / total_weight)
+
+    futures = {}
+    try:
+        for index, ((_, path), prefix) in enumerate(zip(files, _unique_prefixes(name for name, _ in files))):
+            future = pool.submit(_split_file_worker, token, index, path, out_dir, prefix,
+                                 max_size_mb, options)
+            futures[future] = index
+
+        pending = set(futures)
+        while pending:
+            if cancelled and cancelled():
+                marker = os.path.join(out_dir, _CANCEL_MARKER)
+                open(marker, 'w').close()
+                for future in pending:
+                    future.cancel()
+                wait(pending)
+                os.remove(marker)
+                raise SplitCancelled()
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            changed = bool(done)
+            for future in done:
+                result = results[futures[future]]
+                try:
+                    parts, report, worker_metrics = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    result.update(status='error', error=str(e))
+                    continue
+                metrics.merge(worker_metrics)
+                result.update(status='completed', progress=100, parts=parts, recompressed=report)
+
+            while True:
+                try:
+                    index, progress = mailbox.get_nowait()
+                except queue.Empty:
+                    break
+                # Messages may arrive after the file's result
+                if results[index]['status'] in ('queued', 'processing'):
+                    results[index].update(status='processing', progress=progress)
+                    changed = True
+
+            if changed and progress_callback:
+                progress_callback(results, overall())
+    except BrokenProcessPool:
+        pdf_logic._drop_pool(pool)
+        raise
+    finally:
+        del _mailboxes[token]
+        for future in futures:
+            future.cancel()
+    return results
+
+
+def write_archive(out_dir, results, archive_path):
+    """Write the parts of a finished batch to one ZIP at archive_path."""
+    entries = [(part['name'], os.path.join(out_dir, part['name']), part['size'], part['crc32'])
+               for result in results for part in result['parts']]
+    archive = StoredZip(entries)
+    with open(archive_path, 'wb') as out:
+        for chunk in archive.iter_range():
+            out.write(chunk)
+    return archive.size
@@ -0,0 +1,243 @@
+"""
+Benchmarks for pdf_logic.split_pdf on synthetic PDFs.
+
+Each case runs in its own subprocess so peak RSS is measured per case:
+
+    python benchmark.py                          # all cases, results to benchmark_results.json
+    python benchmark.py --case text --case tiny  # a subset
+    python benchmark.py --baseline old.json      # exit 1 on a regression over --threshold
+
+The corpus is generated once into --corpus-dir and reused.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+
+import fitz
+
+LOREM = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud "
+         "exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. ")
+
+
+def _noise_image(width, height, seed):
+    """PNG of random pixels: incompressible, like a scanned photo."""
+    rng = random.Random(seed)
+    samples = rng.randbytes(width * height * 3)
+    return fitz.Pixmap(fitz.csRGB, width, height, samples, False).tobytes("png")
+
+
+def make_text(path):
+    doc = fitz.open()
+    for n in range(400):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (50, 50, -50, -50), f"Página {n + 1}\n\n" + LOREM * 12)
+    doc.save(path, garbage=1, deflate=True)
+
+
+def make_images(path):
+    doc = fitz.open()
+    for n in range(60):
+        page = doc.new_page()
+        page.insert_image(page.rect + (50, 50, -50, -300), stream=_noise_image(320, 240, n))
+        page.insert_text((50, page.rect.height - 250), f"Imagen {n + 1}")
+    doc.save(path, garbage=1, deflate=True)
+
+
+def make_shared_fonts(path):
+    # One large embedded font referenced by every page
+    doc = fitz.open()
+    font = fitz.Font("cjk").buffer
+    for n in range(1500):
+        page = doc.new_page()
+        page.insert_font(fontname="F0", fontbuffer=font)
+        page.insert_textbox(page.rect + (50, 50, -50, -50), f"Página {n + 1} " + LOREM * 8,
+                            fontname="F0")
+    doc.save(path, garbage=1, deflate=True)
+
+
+def make_huge_page(path):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(page.rect, stream=_noise_image(1800, 1400, 0))
+    for n in range(20):
+        page = doc.new_page()
+        page.insert_text((50, 72), f"Página {n + 2}")
+    doc.save(path, garbage=1, deflate=True)
+
+
+def make_tiny(path):
+    doc = fitz.open()
+    for n in range(5000):
+        page = doc.new_page(width=200, height=200)
+        page.insert_text((20, 40), f"{n + 1}")
+    doc.save(path, garbage=1, deflate=True)
+
+
+# name -> (generator, max_size_mb)
+CASES = {
+    'text': (make_text, 0.2),
+    'images': (make_images, 2.0),
+    'shared_fonts': (make_shared_fonts, 2.5),
+    'huge_page': (make_huge_page, 1.0),
+    'tiny': (make_tiny, 0.25),
+}
+
+# Metrics checked against the baseline -> relative change allowed, None for
+# --threshold. Timings and memory are noisy; the plan is deterministic, so
+# any extra part and all but a small drop in fill ratio count. Higher is
+# worse except for the metrics in LOWER_IS_WORSE.
+REGRESSION_METRICS = {'wall_time': None, 'peak_rss_mb': None, 'tobytes_calls': None,
+                      'parts': 0.0, 'fill_ratio': 0.02}
+LOWER_IS_WORSE = ('fill_ratio',)
+
+
+def corpus_path(corpus_dir, name):
+    path = os.path.join(corpus_dir, f"{name}.pdf")
+    if not os.path.exists(path):
+        os.makedirs(corpus_dir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        CASES[name][0](tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(name, path, workers, profile):
+    """Runs in the case subprocess: split path once and return its metrics."""
+    from pdf_logic import split_pdf
+
+    # Count serializations; with workers > 1 the pool processes are not counted
+    calls = [0]
+    tobytes = fitz.Document.tobytes
+
+    def counting_tobytes(self, *args, **kwargs):
+        calls[0] += 1
+        return tobytes(self, *args, **kwargs)
+
+    fitz.Document.tobytes = counting_tobytes
+
+    max_size_mb = CASES[name][1]
+    budget = max_size_mb * 1024 * 1024
+    start = time.perf_counter()
+    parts = split_pdf(path, max_size_mb, workers=workers, profile=profile)
+    wall_time = time.perf_counter() - start
+
+    sizes = [len(content) for _, content in parts]
+    return {
+        'case': name,
+        'max_size_mb': max_size_mb,
+        'input_bytes': os.path.getsize(path),
+        'wall_time': round(wall_time, 4),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'tobytes_calls': calls[0] if workers == 1 else None,
+        'parts': len(parts),
+        'over_limit': sum(1 for size in sizes if size > budget),
+        'fill_ratio': round(sum(sizes) / (len(sizes) * budget), 4) if sizes else 0.0,
+        'min_fill_ratio': round(min(sizes) / budget, 4) if sizes else 0.0,
+    }
+
+
+def run_in_subprocess(name, corpus_dir, workers, profile):
+    command = [sys.executable, os.path.abspath(__file__), '--run-case', name, '--corpus-dir', corpus_dir,
+               '--workers', str(workers), '--profile', profile]
+    result = subprocess.run(command, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"El caso {name} falló:\n{result.stderr}")
+    # The split logs to stdout; the metrics are the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    """
+    Return a description of every metric worse than baseline by more than
+    its bound in REGRESSION_METRICS (threshold for timings and memory).
+    """
+    previous = {entry['case']: entry for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        old = previous.get(entry['case'])
+        if old is None:
+            continue
+        for metric, allowed in REGRESSION_METRICS.items():
+            before, after = old.get(metric), entry.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if metric in LOWER_IS_WORSE else change
+            if worse > (threshold if allowed is None else allowed):
+                regressions.append(f"{entry['case']}.{metric}: {before} -> {after} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de split_pdf con PDFs sintéticos")
+    parser.add_argument('--case', action='append', choices=sorted(CASES),
+                        help="caso a ejecutar (repetible, por defecto todos)")
+    parser.add_argument('--corpus-dir', default='benchmark_corpus')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="resultados anteriores con los que comparar")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="empeoramiento relativo de tiempo y memoria permitido frente al "
+                             "baseline (0.2 = 20%%)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="ejecuciones por caso; se guarda la más rápida")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--profile', default='balanced')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        path = corpus_path(args.corpus_dir, args.run_case)
+        print(json.dumps(run_case(args.run_case, path, args.workers, args.profile)))
+        return 0
+
+    results = []
+    for name in args.case or list(CASES):
+        runs = [run_in_subprocess(name, args.corpus_dir, args.workers, args.profile)
+                for _ in range(max(1, args.repeat))]
+        best = min(runs, key=lambda run: run['wall_time'])
+        best['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+        results.append(best)
+        print(f"{name:>13}: {best['wall_time']:.3f} s, {best['peak_rss_mb']} MB, "
+              f"{best['parts']} partes, llenado {best['fill_ratio']:.0%}, "
+              f"tobytes {best['tobytes_calls']}")
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pymupdf': fitz.VersionBind,
+        'workers': args.workers,
+        'profile': args.profile,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regresiones:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("Sin regresiones")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
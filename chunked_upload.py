@@ -0,0 +1,135 @@
+import os
+import time
+import hashlib
+import threading
+
+
+class ChunkedUpload:
+    """
+    One resumable upload assembled in place on disk. Chunks may arrive in
+    any order and in parallel; each is written at its offset and the
+    sha256 is advanced over the contiguous prefix as soon as it grows, so
+    the digest is ready when the last byte lands.
+
+    Bytes are written once: a chunk sent again (a retry) only fills what
+    is still missing, so what was hashed is what stays on disk. Once
+    finish() has handed the file over, writes are refused.
+    """
+
+    def __init__(self, path, size, filename, max_size, options=None):
+        self.path = path
+        self.size = size
+        self.filename = filename
+        self.max_size = max_size
+        self.options = options or {}
+        self.updated = time.time()
+        self._received = []  # sorted, merged [start, end) ranges
+        self._hasher = hashlib.sha256()
+        self._hashed = 0
+        self._finished = False
+        self._lock = threading.Lock()
+        with open(path, 'wb') as f:
+            f.truncate(size)
+
+    def write(self, offset, stream, chunk_size=64 * 1024):
+        """
+        Write the body of one request at offset, skipping the bytes already
+        received. Returns the bytes read from stream.
+        """
+        if offset < 0 or offset > self.size:
+            raise ValueError("offset fuera de rango")
+
+        position = offset
+        with open(self.path, 'r+b') as f:
+            while True:
+                # Read without the lock: this waits on the network
+                data = stream.read(chunk_size)
+                if not data:
+                    break
+                end = position + len(data)
+                if end > self.size:
+                    raise ValueError("el fragmento excede el tamaño declarado")
+                with self._lock:
+                    if self._finished:
+                        raise ValueError("la subida ya está completa")
+                    for start, stop in self._missing(position, end):
+                        f.seek(start)
+                        f.write(data[start - position:stop - position])
+                        f.flush()
+                        self._add_range(start, stop)
+                    self._advance_hash()
+                    self.updated = time.time()
+                position = end
+        return position - offset
+
+    def _missing(self, start, end):
+        """The parts of [start, end) not received yet."""
+        gaps = []
+        for r_start, r_end in self._received:
+            if r_end <= start or r_start >= end:
+                continue
+            if r_start > start:
+                gaps.append((start, r_start))
+            start = max(start, r_end)
+        if start < end:
+            gaps.append((start, end))
+        return gaps
+
+    def _add_range(self, start, end):
+        ranges = []
+        for r_start, r_end in self._received:
+            if r_end < start or r_start > end:
+                ranges.append((r_start, r_end))
+            else:
+                start, end = min(start, r_start), max(end, r_end)
+        ranges.append((start, end))
+        self._received = sorted(ranges)
+
+    def _advance_hash(self):
+        # Only the first range can start at the hashed offset
+        if not self._received or self._received[0][0] > self._hashed:
+            return
+        end = self._received[0][1]
+        if end <= self._hashed:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._hashed)
+            remaining = end - self._hashed
+            while remaining:
+                data = f.read(min(remaining, 1024 * 1024))
+                if not data:
+                    break
+                self._hasher.update(data)
+                remaining -= len(data)
+        self._hashed = end
+
+    def received(self):
+        with self._lock:
+            return [list(r) for r in self._received]
+
+    def received_bytes(self):
+        with self._lock:
+            return sum(end - start for start, end in self._received)
+
+    def is_complete(self):
+        with self._lock:
+            return self._hashed == self.size
+
+    def sha256(self):
+        with self._lock:
+            return self._hasher.hexdigest()
+
+    def finish(self):
+        """
+        Refuse any further write. Returns the sha256 of the file, or None
+        (and stays open) if it is not complete yet.
+        """
+        with self._lock:
+            if self._hashed != self.size:
+                return None
+            self._finished = True
+            return self._hasher.hexdigest()
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,290 @@
+import os
+import json
+import shutil
+import time
+import sqlite3
+import threading
+
+# Jobs in these states hold no CPU and can be evicted
+_FINISHED = ('completed', 'error', 'cancelled')
+
+
+class JobStore:
+    """
+    Job state keyed by job_id. get() returns a copy; changes go through
+    update() so every backend sees them.
+
+    Finished jobs expire after ttl seconds. Completed results live on disk
+    (job['result_path'], a file or a directory of parts) and are evicted least-recently-downloaded first
+    once they add up to more than max_result_bytes; results younger than
+    grace seconds are kept so their client can still fetch them. Uploads
+    that were never processed expire after ttl as well.
+    """
+
+    def __init__(self, ttl=3600, max_result_bytes=512 * 1024 * 1024, grace=300):
+        self.ttl = ttl
+        self.max_result_bytes = max_result_bytes
+        self.grace = grace
+
+    def create(self, job_id, job):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+    def update(self, job_id, **fields):
+        raise NotImplementedError
+
+    def update_if(self, job_id, current, **fields):
+        """
+        update() as one atomic step, only while the job's status is current.
+        Returns whether it was updated. fields may not set result_path.
+        """
+        raise NotImplementedError
+
+    def touch(self, job_id):
+        """Mark a job's result as recently used (LRU)."""
+        raise NotImplementedError
+
+    def delete(self, job_id):
+        raise NotImplementedError
+
+    def jobs(self, statuses):
+        """(job_id, job) of every job in one of statuses."""
+        raise NotImplementedError
+
+    def total_result_bytes(self):
+        raise NotImplementedError
+
+    def evict(self):
+        """Drop expired jobs, then least recently used results over the byte budget."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _remove_files(job):
+        # job_dir, when set, holds everything else the job wrote
+        for key in ('filepath', 'result_path', 'job_dir'):
+            path = job.get(key)
+            if path and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _result_size(fields):
+        path = fields.get('result_path')
+        if path and os.path.isdir(path):
+            return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+        if path and os.path.exists(path):
+            return os.path.getsize(path)
+        return 0
+
+
+class MemoryJobStore(JobStore):
+    """Jobs in a dict of this process. Fine for a single gunicorn worker."""
+
+    def __init__(self, ttl=3600, max_result_bytes=512 * 1024 * 1024, grace=300):
+        super().__init__(ttl, max_result_bytes, grace)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, job):
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = dict(job, created=now, updated=now, accessed=now, result_size=0)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if 'result_path' in fields:
+                fields['result_size'] = self._result_size(fields)
+            job.update(fields)
+            job['updated'] = time.time()
+
+    def update_if(self, job_id, current, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != current:
+                return False
+            job.update(fields)
+            job['updated'] = time.time()
+            return True
+
+    def touch(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job['accessed'] = time.time()
+
+    def delete(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            self._remove_files(job)
+
+    def jobs(self, statuses):
+        with self._lock:
+            return [(job_id, dict(job)) for job_id, job in self._jobs.items() if job['status'] in statuses]
+
+    def total_result_bytes(self):
+        with self._lock:
+            return sum(job['result_size'] for job in self._jobs.values())
+
+    def evict(self):
+        now = time.time()
+        expired = []
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                idle = job['status'] in _FINISHED or job['status'] == 'uploaded'
+                if idle and now - job['updated'] > self.ttl:
+                    expired.append(self._jobs.pop(job_id))
+
+            total = sum(job['result_size'] for job in self._jobs.values())
+            if total > self.max_result_bytes:
+                completed = sorted((job['accessed'], job_id) for job_id, job in self._jobs.items()
+                                   if job['status'] == 'completed' and now - job['updated'] > self.grace)
+                for _, job_id in completed:
+                    if total <= self.max_result_bytes:
+                        break
+                    job = self._jobs.pop(job_id)
+                    total -= job['result_size']
+                    expired.append(job)
+
+        for job in expired:
+            self._remove_files(job)
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Jobs in a SQLite file, so several gunicorn workers on one host share
+    job state. Each thread gets its own connection.
+    """
+
+    def __init__(self, path, ttl=3600, max_result_bytes=512 * 1024 * 1024, grace=300):
+        super().__init__(ttl, max_result_bytes, grace)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    updated REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    result_size INTEGER NOT NULL DEFAULT 0
+                )""")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit; read-modify-write updates open their own transaction
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id, job):
+        now = time.time()
+        job = dict(job, created=now)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, 0)",
+                         (job_id, job['status'], json.dumps(job), now, now))
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT data, updated, accessed, result_size FROM jobs WHERE job_id = ?",
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row[0])
+        job.update(updated=row[1], accessed=row[2], result_size=row[3])
+        return job
+
+    def update(self, job_id, **fields):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT data, result_size FROM jobs WHERE job_id = ?",
+                               (job_id,)).fetchone()
+            if row is None:
+                return
+            job = json.loads(row[0])
+            job.update(fields)
+            result_size = self._result_size(fields) if 'result_path' in fields else row[1]
+            conn.execute("UPDATE jobs SET status = ?, data = ?, updated = ?, result_size = ? WHERE job_id = ?",
+                         (job['status'], json.dumps(job), time.time(), result_size, job_id))
+
+    def update_if(self, job_id, current, **fields):
+        # A single statement: the status check and the write cannot interleave
+        # with another worker's
+        paths = ''.join(", '$.' || ?, json(?)" for _ in fields)
+        values = [value for key, value in fields.items() for value in (key, json.dumps(value))]
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET status = ?, data = json_set(data{paths}), updated = ?"
+                " WHERE job_id = ? AND status = ?",
+                (fields.get('status', current), *values, time.time(), job_id, current))
+        return cursor.rowcount == 1
+
+    def touch(self, job_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET accessed = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def delete(self, job_id):
+        job = self.get(job_id)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        if job is not None:
+            self._remove_files(job)
+
+    def jobs(self, statuses):
+        rows = self._connect().execute(
+            f"SELECT job_id FROM jobs WHERE status IN ({', '.join('?' * len(statuses))})",
+            tuple(statuses)).fetchall()
+        found = [(row[0], self.get(row[0])) for row in rows]
+        return [(job_id, job) for job_id, job in found if job is not None]
+
+    def total_result_bytes(self):
+        row = self._connect().execute("SELECT COALESCE(SUM(result_size), 0) FROM jobs").fetchone()
+        return row[0]
+
+    def evict(self):
+        now = time.time()
+        cutoff = now - self.ttl
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT job_id, data, result_size FROM jobs"
+            " WHERE status IN ('completed', 'error', 'cancelled', 'uploaded') AND updated < ?",
+            (cutoff,)).fetchall()
+
+        expired_ids = {row[0] for row in rows}
+        total = self.total_result_bytes() - sum(row[2] for row in rows)
+        if total > self.max_result_bytes:
+            for row in conn.execute(
+                    "SELECT job_id, data, result_size FROM jobs"
+                    " WHERE status = 'completed' AND updated < ? ORDER BY accessed",
+                    (now - self.grace,)):
+                if total <= self.max_result_bytes:
+                    break
+                if row[0] not in expired_ids:
+                    rows.append(row)
+                    total -= row[2]
+
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(row[0],) for row in rows])
+        for _, data, _ in rows:
+            self._remove_files(json.loads(data))
+        return len(rows)
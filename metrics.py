@@ -0,0 +1,108 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the span histogram buckets
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+_lock = threading.Lock()
+_spans = {}     # name -> [bucket counts..., count, sum]
+_counters = {}  # name -> value
+_gauges = {}    # name -> (help, callable)
+
+
+def observe(name, seconds):
+    """Record one duration of the span name."""
+    with _lock:
+        entry = _spans.get(name)
+        if entry is None:
+            entry = _spans[name] = [0] * len(_BUCKETS) + [0, 0.0]
+        for n, bound in enumerate(_BUCKETS):
+            if seconds <= bound:
+                entry[n] += 1
+                break
+        entry[-2] += 1
+        entry[-1] += seconds
+
+
+@contextmanager
+def span(name):
+    """Time the body of a with block as one observation of name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def inc(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def gauge(name, help_text, fn):
+    """Register fn() as the current value of name; it is read at scrape time."""
+    with _lock:
+        _gauges[name] = (help_text, fn)
+
+
+def drain():
+    """
+    Take the spans and counters recorded in this process, resetting them.
+    Pool processes return this to the parent, which merge()s it.
+    """
+    with _lock:
+        data = {'spans': {name: list(entry) for name, entry in _spans.items()},
+                'counters': dict(_counters)}
+        _spans.clear()
+        _counters.clear()
+    return data
+
+
+def merge(data):
+    with _lock:
+        for name, other in data['spans'].items():
+            entry = _spans.get(name)
+            if entry is None:
+                _spans[name] = list(other)
+            else:
+                for n, value in enumerate(other):
+                    entry[n] += value
+        for name, value in data['counters'].items():
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def _bound(value):
+    return '+Inf' if value == float('inf') else f"{value:g}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        spans = {name: list(entry) for name, entry in _spans.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+
+    lines = ["# HELP pdfdiv_span_seconds Duration of instrumented operations.",
+             "# TYPE pdfdiv_span_seconds histogram"]
+    for name, entry in sorted(spans.items()):
+        cumulative = 0
+        for bound, count in zip(_BUCKETS, entry):
+            cumulative += count
+            lines.append(f'pdfdiv_span_seconds_bucket{{span="{name}",le="{_bound(bound)}"}} {cumulative}')
+        lines.append(f'pdfdiv_span_seconds_count{{span="{name}"}} {entry[-2]}')
+        lines.append(f'pdfdiv_span_seconds_sum{{span="{name}"}} {entry[-1]:.6f}')
+
+    for name, value in sorted(counters.items()):
+        lines.append(f"# TYPE pdfdiv_{name}_total counter")
+        lines.append(f"pdfdiv_{name}_total {value}")
+
+    for name, (help_text, fn) in sorted(gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            continue
+        lines.append(f"# HELP pdfdiv_{name} {help_text}")
+        lines.append(f"# TYPE pdfdiv_{name} gauge")
+        lines.append(f"pdfdiv_{name} {value}")
+    return "\n".join(lines) + "\n"
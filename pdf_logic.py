@@ -1,77 +1,1154 @@
 import os
 import io
+import re
+import math
+import mmap
+import time
+import zlib
+import hashlib
+import itertools
+import logging
+import collections
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 import fitz  # PyMuPDF
 
-def split_pdf(input_stream, max_size_mb, progress_callback=None):
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a change makes split output differ for the same input, so
+# cached results from older versions are not served
+ALGORITHM_VERSION = 5
+
+# Indirect references inside an object's source ("12 0 R")
+_REF_RE = re.compile(r"(\d+) \d+ R")
+# Page tree nodes link every page to every other page; following them
+# would charge the whole document to each page.
+_TREE_TYPES = ("/Page", "/Pages", "/Catalog")
+# "N 0 obj ... endobj" wrapper plus the xref table entry
+_OBJ_OVERHEAD = 40
+# Header, catalog, page tree and trailer of an otherwise empty part
+_PART_OVERHEAD = 400
+# Below this many pages the process pool costs more than it saves
+_PARALLEL_MIN_PAGES = 50
+# Unfiltered streams are sampled up to this size to estimate their deflated size
+_DEFLATE_SAMPLE = 256 * 1024
+
+
+class SplitCancelled(Exception):
+    """Raised by iter_split_pdf when its cancelled() callable returns True."""
+
+
+# Output profiles: how each part is written, and how the planner estimates
+# object sizes under those options.
+#   save: options for Document.tobytes()
+#   subset_fonts: subset embedded fonts to the glyphs the part uses
+#   deflate: unfiltered streams will be compressed
+#   objstms: non-stream objects are packed into compressed object streams
+OUTPUT_PROFILES = {
+    'fast': {
+        'save': {},
+        'subset_fonts': False, 'deflate': False, 'objstms': False,
+    },
+    'balanced': {
+        'save': {'garbage': 1, 'deflate': True, 'deflate_images': True, 'deflate_fonts': True},
+        'subset_fonts': False, 'deflate': True, 'objstms': False,
+    },
+    'smallest': {
+        'save': {'garbage': 4, 'deflate': True, 'deflate_images': True, 'deflate_fonts': True,
+                 'use_objstms': 1},
+        'subset_fonts': True, 'deflate': True, 'objstms': True,
+    },
+}
+DEFAULT_PROFILE = 'balanced'
+
+# (JPEG quality, DPI cap) steps tried in order until an oversized page fits
+_RECOMPRESS_LADDER = ((85, 300), (75, 200), (60, 150), (50, 110), (40, 72))
+# Images below this size are not worth re-encoding
+_RECOMPRESS_MIN_BYTES = 32 * 1024
+
+# Split strategies: a list of (step, argument) applied in order, each step
+# cutting every segment left by the previous one. 'size' packs the
+# segments into parts under a byte limit and, when present, is the last
+# step. See parse_strategy for the text form ("bookmarks+size").
+#   size: limit in MB (None = the max_size_mb argument)
+#   pages: N pages per part
+#   ranges: explicit 0-based (first, last) page ranges, pages outside are dropped
+#   bookmarks: cut before every outline entry up to this level
+#   blank: cut at blank pages, which are dropped
+STRATEGY_STEPS = ('size', 'pages', 'ranges', 'bookmarks', 'blank')
+DEFAULT_STRATEGY = [('size', None)]
+
+# Share of the progress bar given to parsing until serialization has been
+# timed, and the most often progress is reported (seconds)
+_PARSE_SHARE = 0.2
+_PROGRESS_INTERVAL = 0.1
+
+# Blank page detection. Pages whose content stream paints nothing are
+# blank outright; pages that do paint (typically a scanned image) are
+# rendered this many pixels wide in gray and count as blank if fewer than
+# _BLANK_INK_RATIO of the pixels are darker than _BLANK_DARK_LEVEL.
+_BLANK_RENDER_WIDTH = 100
+_BLANK_DARK_LEVEL = 200
+_BLANK_INK_RATIO = 0.002
+_BLANK_DARK_BYTES = bytes(range(_BLANK_DARK_LEVEL))
+# Content stream operators that show text or paint something
+_TEXT_OPS_RE = re.compile(rb"\b(?:Tj|TJ)\b|['\"]")
+_PAINT_OPS_RE = re.compile(rb"\b(?:Do|sh|BI|f\*?|F|B\*?|b\*?|S|s)\b")
+
+
+def _stream_cost(doc, xref, profile):
+    kind, value = doc.xref_get_key(xref, "Length")
+    if profile['deflate'] and doc.xref_get_key(xref, "Filter")[0] == "null":
+        # Will be deflated on save: estimate from a compressed sample
+        raw = doc.xref_stream_raw(xref) or b""
+        sample = raw[:_DEFLATE_SAMPLE]
+        if not sample:
+            return 0
+        return int(len(zlib.compress(sample)) * len(raw) / len(sample))
+    if kind == "int":
+        return int(value)
+    return len(doc.xref_stream_raw(xref) or b"")
+
+
+def _xref_node(doc, xref, nodes, profile):
     """
-    Split PDF using PyMuPDF (fitz) - significantly faster than pypdf.
+    Return (cost, children, is_tree_node) for one xref, computed once per
+    document, with its size estimated under the output profile.
+    """
+    node = nodes.get(xref)
+    if node is not None:
+        return node
+
+    try:
+        source = doc.xref_object(xref, compressed=True)
+    except Exception:
+        node = (0, (), True)
+        nodes[xref] = node
+        return node
+
+    obj_type = doc.xref_get_key(xref, "Type")[1]
+    is_tree_node = obj_type in _TREE_TYPES
+
+    if doc.xref_is_stream(xref):
+        cost = len(source) + _OBJ_OVERHEAD + _stream_cost(doc, xref, profile)
+    elif profile['objstms']:
+        # Packed with its neighbours into a deflated object stream
+        cost = len(source) // 2 + 8
+    else:
+        cost = len(source) + _OBJ_OVERHEAD
+
+    children = tuple(int(ref) for ref in _REF_RE.findall(source))
+    node = (cost, children, is_tree_node)
+    nodes[xref] = node
+    return node
+
+
+def _page_objects(doc, page_xref, nodes, profile):
+    """
+    Collect every xref a page pulls into a part: its content streams and
+    all resources (images, fonts, ICC profiles...), including resources
+    inherited from the page tree.
+    """
+    objects = {page_xref}
+    stack = list(_xref_node(doc, page_xref, nodes, profile)[1])
+
+    # Inherited /Resources live on the /Pages ancestors
+    parent = doc.xref_get_key(page_xref, "Parent")
+    while parent[0] == "xref":
+        parent_xref = int(parent[1].split()[0])
+        kind, value = doc.xref_get_key(parent_xref, "Resources")
+        if kind in ("xref", "dict"):
+            stack.extend(int(ref) for ref in _REF_RE.findall(value))
+        parent = doc.xref_get_key(parent_xref, "Parent")
+
+    while stack:
+        xref = stack.pop()
+        if xref in objects:
+            continue
+        cost, children, is_tree_node = _xref_node(doc, xref, nodes, profile)
+        if is_tree_node:
+            continue
+        objects.add(xref)
+        stack.extend(children)
+
+    return frozenset(objects)
+
+
+def _plan_ranges(page_objects, costs, first, last, budget, overhead, scale=1.0):
+    """
+    Bin-pack the contiguous pages first..last into ranges whose estimated size
+    stays under budget. Objects shared by several pages (fonts, repeated
+    images) are only charged once per range.
+    """
+    ranges = []
+    start = first
+    seen = set()
+    size = overhead
+
+    for i in range(first, last + 1):
+        new_objects = page_objects[i] - seen
+        added = sum(costs[x] for x in new_objects) * scale
+
+        if i > start and size + added > budget:
+            ranges.append((start, i - 1))
+            start = i
+            seen = set()
+            size = overhead
+            new_objects = page_objects[i]
+            added = sum(costs[x] for x in new_objects) * scale
+
+        seen |= new_objects
+        size += added
+
+    ranges.append((start, last))
+    return ranges
+
+
+def _estimate_range(page_objects, costs, first, last, overhead):
+    objects = set()
+    for i in range(first, last + 1):
+        objects |= page_objects[i]
+    return overhead + sum(costs[x] for x in objects)
+
+
+def _measured_scale(page_objects, costs, first, last, size):
+    """Measured over estimated size of pages first..last, which serialized to size bytes."""
+    return size / max(_estimate_range(page_objects, costs, first, last, _PART_OVERHEAD), 1)
+
+
+def _resplit(page_objects, costs, first, last, budget, size):
+    """Re-plan a multi-page range that serialized to size bytes, over budget."""
+    scale = _measured_scale(page_objects, costs, first, last, size)
+    sub_ranges = _plan_ranges(page_objects, costs, first, last, budget, _PART_OVERHEAD, scale)
+    if len(sub_ranges) == 1:
+        middle = (first + last) // 2
+        sub_ranges = [(first, middle), (middle + 1, last)]
+    return sub_ranges
+
+
+def _import_range(doc, first, last):
+    """A new document with pages first..last of doc, grafted in one call."""
+    part_doc = fitz.open()
+    part_doc.insert_pdf(doc, from_page=first, to_page=last)
+    return part_doc
+
+
+def _save_part(part_doc, profile):
+    """Serialize part_doc under profile. Subsetting modifies part_doc in place."""
+    if profile['subset_fonts']:
+        part_doc.subset_fonts()
+    buffer = part_doc.tobytes(**profile['save'])
+    metrics.inc('parts_serialized')
+    return buffer
+
+
+def _serialize_range(doc, first, last, profile):
+    with metrics.span('serialize_part'):
+        part_doc = _import_range(doc, first, last)
+        buffer = _save_part(part_doc, profile)
+        part_doc.close()
+    return buffer
+
+
+def _reencode_image(part_doc, page, image, quality, dpi_cap, image_cache):
+    """
+    JPEG bytes for one image at the given quality, downsampled to dpi_cap at
+    its displayed size, or None if that would not make it smaller. Results
+    are cached by source digest so an image repeated on many pages is only
+    encoded once per step.
+    """
+    xref, width, height = image[0], image[2], image[3]
+    raw = part_doc.xref_stream_raw(xref)
+
+    target_w, target_h = width, height
+    rects = page.get_image_rects(xref)
+    if rects:
+        shown_w = max(rect.width for rect in rects)
+        if shown_w > 0:
+            dpi = width / (shown_w / 72)
+            if dpi > dpi_cap:
+                factor = dpi_cap / dpi
+                target_w = max(1, int(width * factor))
+                target_h = max(1, int(height * factor))
+
+    key = (hashlib.sha1(raw).hexdigest(), quality, target_w, target_h)
+    if key not in image_cache:
+        pix = fitz.Pixmap(part_doc, xref)
+        if pix.alpha:
+            pix = fitz.Pixmap(pix, 0)
+        if pix.colorspace is None or pix.colorspace.n not in (1, 3):
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        if (target_w, target_h) != (pix.width, pix.height):
+            pix = fitz.Pixmap(pix, target_w, target_h, None)
+        data = pix.tobytes("jpeg", jpg_quality=quality)
+        image_cache[key] = data if len(data) < len(raw) else None
+    return image_cache[key]
+
+
+def _recompress_page(doc, index, budget, profile, image_cache):
+    """
+    Re-encode the dominant images of page index, walking down the quality /
+    DPI ladder until the single-page part fits the budget. Each step starts
+    again from the original images. Returns the smallest serialization.
+    """
+    best = None
+    # Graft the page out of the source once; every step copies this
+    original = _import_range(doc, index, index)
+    for quality, dpi_cap in _RECOMPRESS_LADDER:
+        part_doc = _import_range(original, 0, 0)
+        page = part_doc[0]
+
+        # Images with a soft mask need their alpha: JPEG cannot carry it
+        images = [image for image in page.get_images(full=True)
+                  if image[1] == 0 and len(part_doc.xref_stream_raw(image[0])) >= _RECOMPRESS_MIN_BYTES]
+        if not images:
+            part_doc.close()
+            break
+        images.sort(key=lambda image: len(part_doc.xref_stream_raw(image[0])), reverse=True)
+
+        for image in images:
+            data = _reencode_image(part_doc, page, image, quality, dpi_cap, image_cache)
+            if data is not None:
+                page.replace_image(image[0], stream=data)
+
+        if profile['subset_fonts']:
+            part_doc.subset_fonts()
+        # Collect the replaced image objects even in the fast profile
+        save = dict(profile['save'], garbage=max(profile['save'].get('garbage', 0), 1))
+        buffer = part_doc.tobytes(**save)
+        part_doc.close()
+
+        if best is None or len(buffer) < len(best):
+            best = buffer
+        if len(buffer) <= budget:
+            break
+    original.close()
+    return best
+
+
+def _emit_range(doc, first, last, budget, verify, profile, page_objects=None, costs=None,
+                recompress=False, image_cache=None, report=None, carry=None, first_part=None):
+    """
+    Serialize pages first..last and yield (first, last, bytes). With verify=True
+    a multi-page part over budget is re-planned with its measured size and
+    its pieces are emitted instead. The pieces are copied out of the part
+    already built rather than grafted from doc again, so the objects they
+    share are resolved against the source only once. page_objects/costs are
+    computed for the range on demand when the caller has no plan at hand
+    (process workers).
+
+    If carry is a dict, only the first piece of a part over budget is
+    emitted (re-split again if it is still over); carry['first'] is set to
+    the first page left out and carry['scale'] to the measured over
+    estimated size, so the caller re-plans those pages together with the
+    rest of their segment (see _carry_over) instead of leaving a sliver.
+
+    first_part, a (document, bytes) pair already built from pages
+    first..last, is used instead of serializing them again.
+
+    With recompress=True a single page that is over budget on its own has
+    its images re-encoded (see _recompress_page); before/after sizes are
+    appended to report.
+    """
+    range_first, range_last = first, last
+    # (first, last, document to copy the pages from, its first page in doc)
+    ranges = [(first, last, doc, 0)]
+    while ranges:
+        first, last, source, offset = ranges.pop(0)
+        if first_part is not None:
+            part_doc, buffer = first_part
+            first_part = None
+        else:
+            with metrics.span('serialize_part'):
+                part_doc = _import_range(source, first - offset, last - offset)
+                buffer = _save_part(part_doc, profile)
+        if source is not doc and not any(entry[2] is source for entry in ranges):
+            source.close()
+
+        if verify and len(buffer) > budget and last > first:
+            if page_objects is None:
+                nodes = {}
+                page_objects = {i: _page_objects(doc, doc.page_xref(i), nodes, profile)
+                                for i in range(range_first, range_last + 1)}
+                costs = {xref: node[0] for xref, node in nodes.items()}
+            # Estimate was too optimistic: serialize the pieces instead
+            sub_ranges = _resplit(page_objects, costs, first, last, budget, len(buffer))
+            if carry is not None:
+                # The caller re-plans the pages after the first piece
+                carry['first'] = sub_ranges[0][1] + 1
+                carry['scale'] = _measured_scale(page_objects, costs, first, last, len(buffer))
+                sub_ranges = sub_ranges[:1]
+                logger.debug("Pages %d-%d over limit (%d bytes), keeping %d-%d",
+                             first + 1, last + 1, len(buffer), first + 1, sub_ranges[0][1] + 1)
+            else:
+                logger.debug("Pages %d-%d over limit (%d bytes), re-split into %d",
+                             first + 1, last + 1, len(buffer), len(sub_ranges))
+            metrics.inc('resplits')
+            ranges[:0] = [(sub_first, sub_last, part_doc, first) for sub_first, sub_last in sub_ranges]
+            continue
+        part_doc.close()
+
+        if recompress and last == first and len(buffer) > budget:
+            smaller = _recompress_page(doc, first, budget, profile,
+                                       image_cache if image_cache is not None else {})
+            if smaller is not None and len(smaller) < len(buffer):
+                logger.debug("Page %d recompressed from %d to %d bytes", first + 1, len(buffer), len(smaller))
+                metrics.inc('pages_recompressed')
+                if report is not None:
+                    report.append({'page': first + 1, 'before': len(buffer), 'after': len(smaller)})
+                buffer = smaller
+
+        yield (first, last, buffer)
+
+
+def _parse_page_ranges(text):
+    ranges = []
+    for item in text.split(','):
+        start, _, end = item.partition('-')
+        first = int(start)
+        last = int(end) if end.strip() else first
+        if first < 1 or last < first:
+            raise ValueError(item)
+        ranges.append((first - 1, last - 1))
+    return ranges
+
+
+def _no_argument(arg):
+    if arg:
+        raise ValueError(arg)
+    return None
+
+
+# Text argument parser of each strategy step
+_STRATEGY_ARGS = {
+    'size': lambda arg: float(arg) if arg else None,
+    'pages': int,
+    'ranges': _parse_page_ranges,
+    'bookmarks': lambda arg: int(arg) if arg else 1,
+    'blank': _no_argument,
+}
+
+
+def parse_strategy(text):
+    """
+    Parse a strategy string into a list of steps. Steps are joined with "+"
+    and take an optional argument after ":", e.g. "bookmarks+size:4",
+    "blank+pages:10" or "ranges:1-5,6,7-12". Page numbers are 1-based.
+    """
+    steps = []
+    for item in text.split('+'):
+        name, _, arg = item.strip().partition(':')
+        name, arg = name.strip().lower(), arg.strip()
+        if name not in _STRATEGY_ARGS:
+            raise ValueError(f"Estrategia desconocida: {name}")
+        try:
+            steps.append((name, _STRATEGY_ARGS[name](arg)))
+        except ValueError:
+            raise ValueError(f"Argumento no válido en la estrategia: {item.strip()}") from None
+    _check_strategy(steps)
+    return steps
+
+
+def parse_max_size(value):
+    """Maximum part size in MB as a float; it must be a finite number above 0."""
+    try:
+        max_size_mb = float(value)
+    except (TypeError, ValueError):
+        max_size_mb = math.nan
+    if not (math.isfinite(max_size_mb) and max_size_mb > 0):
+        raise ValueError(f"Tamaño máximo no válido: {value}")
+    return max_size_mb
+
+
+def _check_strategy(steps):
+    if not steps:
+        raise ValueError("La estrategia está vacía")
+    for n, (name, arg) in enumerate(steps):
+        if name not in STRATEGY_STEPS:
+            raise ValueError(f"Estrategia desconocida: {name}")
+        if name == 'size' and n != len(steps) - 1:
+            raise ValueError("El tamaño debe ser el último paso de la estrategia")
+        if name in ('pages', 'bookmarks') and arg < 1:
+            raise ValueError(f"Argumento no válido en la estrategia: {name}:{arg}")
+        if name == 'size' and arg is not None:
+            parse_max_size(arg)
+
+
+def _is_blank(doc, index):
+    """
+    Heuristic blank page test. The content stream is checked first; only
+    pages that paint something are rendered, and only at thumbnail size.
+    """
+    page = doc[index]
+    contents = b"".join(doc.xref_stream(xref) or b"" for xref in page.get_contents())
+    has_text = bool(_TEXT_OPS_RE.search(contents))
+    if not has_text and not _PAINT_OPS_RE.search(contents):
+        return True
+    if has_text and page.get_text().strip():
+        return False
+
+    zoom = _BLANK_RENDER_WIDTH / max(page.rect.width, 1)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    samples = pix.samples
+    dark = len(samples) - len(samples.translate(None, _BLANK_DARK_BYTES))
+    return dark <= len(samples) * _BLANK_INK_RATIO
+
+
+def _segment(steps, doc, first, last, blank_pages):
+    """Cut first..last with each non-size step in turn. Returns a list of ranges."""
+    segments = [(first, last)]
+    for name, arg in steps:
+        if name == 'size':
+            continue
+        if name == 'bookmarks':
+            starts = {entry[2] - 1 for entry in doc.get_toc(simple=True)
+                      if entry[0] <= arg and entry[2] >= 1}
+        cut = []
+        for first, last in segments:
+            if name == 'pages':
+                cut.extend((start, min(start + arg - 1, last)) for start in range(first, last + 1, arg))
+            elif name == 'ranges':
+                cut.extend((max(a, first), min(b, last)) for a, b in arg if a <= last and b >= first)
+            elif name == 'bookmarks':
+                start = first
+                for i in range(first + 1, last + 1):
+                    if i in starts:
+                        cut.append((start, i - 1))
+                        start = i
+                cut.append((start, last))
+            elif name == 'blank':
+                start = None
+                for i in range(first, last + 1):
+                    if i in blank_pages:
+                        if start is not None:
+                            cut.append((start, i - 1))
+                        start = None
+                    elif start is None:
+                        start = i
+                if start is not None:
+                    cut.append((start, last))
+        segments = cut
+    return segments
+
+
+def _scan_document(doc, profile, progress_callback=None, objects=True, blank=False):
+    """
+    Planning phase: one pass over the pages, no serialization. Collects the
+    object closure of each page (for size planning) and/or whether it is
+    blank. progress_callback(pages done, total) is called after each page.
+    Returns (page_objects, costs, blank_pages).
     """
-    if progress_callback:
-        progress_callback(0)
-        
-    print(f"DEBUG: Starting split_pdf with max_size_mb={max_size_mb}")
-    
-    # Load PDF from stream
-    doc = fitz.open(stream=input_stream, filetype="pdf")
     total_pages = len(doc)
-    max_size_bytes = max_size_mb * 1024 * 1024
-    safety_factor = 0.95
-    
-    parts = []
-    current_doc = fitz.open()
-    part_num = 1
-    
-    print(f"DEBUG: PDF has {total_pages} pages")
-    
+    nodes = {}
+    page_objects = [] if objects else None
+    blank_pages = set()
     for i in range(total_pages):
-        # Add page to current part
-        current_doc.insert_pdf(doc, from_page=i, to_page=i)
-        
-        # Report progress
+        if objects:
+            page_objects.append(_page_objects(doc, doc.page_xref(i), nodes, profile))
+        if blank and _is_blank(doc, i):
+            blank_pages.add(i)
         if progress_callback:
-            percent = int(((i + 1) / total_pages) * 100)
-            progress_callback(percent)
-        
-        # Check size periodically (every 5 pages or at the end)
-        if (i + 1) % 5 == 0 or i == total_pages - 1:
-            buffer = current_doc.tobytes()
-            current_size = len(buffer)
-            
-            # If over limit, backtrack
-            if current_size > max_size_bytes * safety_factor:
-                # If it's just one page and it's over, we must send it
-                if len(current_doc) > 1:
-                    # Remove the last 5 pages added and do them one by one
-                    # Simplified logic for fast response:
-                    # Actually, PyMuPDF is so fast we can just check more often
-                    # or do a more precise split.
-                    
-                    # Backtrack: Rebuild part without the last batch
-                    # But let's keep it simple: just close this part BEFORE the batch
-                    # if the batch makes it too big.
-                    
-                    # More precise: remove pages until it fits
-                    while len(current_doc) > 1 and len(buffer) > max_size_bytes * safety_factor:
-                        current_doc.delete_page(len(current_doc) - 1)
-                        buffer = current_doc.tobytes()
-                        i -= 1 # Return index to process these pages in the next part
-                    
-                    parts.append((f"parte_{part_num:03d}.pdf", buffer))
-                    print(f"DEBUG: Saved part {part_num} with {len(current_doc)} pages")
-                    part_num += 1
-                    current_doc = fitz.open()
-                else:
-                    # Single big page
-                    parts.append((f"parte_{part_num:03d}.pdf", buffer))
-                    print(f"DEBUG: Saved part {part_num} (single page)")
-                    part_num += 1
-                    current_doc = fitz.open()
-            
-            elif i == total_pages - 1:
-                # Final part
-                parts.append((f"parte_{part_num:03d}.pdf", buffer))
-                print(f"DEBUG: Saved final part {part_num}")
-
-    doc.close()
-    print(f"DEBUG: Completed splitting into {len(parts)} parts")
-    return parts
+            progress_callback(i + 1, total_pages)
+
+    costs = {xref: node[0] for xref, node in nodes.items()} if objects else None
+    return page_objects, costs, blank_pages
+
+
+def _plan_segments(page_objects, costs, segments, budget, scale=1.0):
+    """
+    Pack every segment into parts. Returns (ranges, owners): owners[i] is
+    the index in segments of the one ranges[i] was planned from.
+    """
+    ranges, owners = [], []
+    for owner, (first, last) in enumerate(segments):
+        planned = _plan_ranges(page_objects, costs, first, last, budget, _PART_OVERHEAD, scale)
+        ranges.extend(planned)
+        owners.extend([owner] * len(planned))
+    return ranges, owners
+
+
+def _resolve_strategy(strategy, max_size_mb):
+    """
+    Normalize strategy (None, text or steps) to a list of steps. Returns
+    (steps, sized, max_size_mb); a "size:N" step overrides max_size_mb.
+    """
+    if strategy is None:
+        strategy = DEFAULT_STRATEGY
+    elif isinstance(strategy, str):
+        strategy = parse_strategy(strategy)
+    else:
+        _check_strategy(strategy)
+    sized = strategy[-1][0] == 'size'
+    if sized and strategy[-1][1] is not None:
+        max_size_mb = strategy[-1][1]
+    if sized:
+        if max_size_mb is None:
+            raise ValueError("Falta el tamaño máximo por parte")
+        max_size_mb = parse_max_size(max_size_mb)
+    return strategy, sized, max_size_mb
+
+
+def _budget(sized, max_size_mb):
+    """Bytes the planner packs parts against, with a safety margin."""
+    return max_size_mb * 1024 * 1024 * 0.95 if sized else float('inf')
+
+
+def _calibration(page_objects, costs, first, last, size):
+    """Measured over estimated size of a serialized range, clamped to 0.5-2."""
+    return min(max(_measured_scale(page_objects, costs, first, last, size), 0.5), 2.0)
+
+
+def _carry_over(ranges, owners, index, carry, page_objects, costs, segments, budget):
+    """
+    (ranges, owners) once ranges[index] has been emitted only up to
+    carry['first'] (see _emit_range): the pages left out are planned again
+    together with the ranges after them in their segment, at the scale
+    measured on the part that overflowed. Ranges of other segments are kept
+    as they are, whatever pages they hold (strategies may reorder or repeat
+    pages).
+    """
+    first = carry['first']
+    owner = owners[index]
+    replanned = _plan_ranges(page_objects, costs, first, segments[owner][1], budget, _PART_OVERHEAD,
+                             carry['scale'])
+    rest = index + 1
+    while rest < len(ranges) and owners[rest] == owner:
+        rest += 1
+    return (ranges[:index] + [(ranges[index][0], first - 1)] + replanned + ranges[rest:],
+            owners[:index + 1] + [owner] * len(replanned) + owners[rest:])
+
+
+def _plan(doc, steps, sized, page_objects, costs, blank_pages, budget):
+    """
+    Cut the document with the strategy. Returns (segments, ranges, owners)
+    with 0-based page ranges; see _plan_segments for owners.
+    """
+    segments = _segment(steps, doc, 0, len(doc) - 1, blank_pages)
+    if not segments:
+        raise ValueError("La estrategia no deja ninguna página")
+    if not sized:
+        return segments, segments, list(range(len(segments)))
+    return (segments,) + _plan_segments(page_objects, costs, segments, budget)
+
+
+class _Progress:
+    """
+    Progress of one split as a percentage that never goes backwards,
+    reported on every phase change and otherwise at most every
+    _PROGRESS_INTERVAL seconds; the cancelled() check runs on every event.
+
+    Each phase gets the share of the bar its duration takes. Parsing runs
+    to _PARSE_SHARE; once parts are being serialized, the time spent so far
+    is set against the serialization time projected from the wall time per
+    unit of work done. A page's units are its estimated bytes, shared
+    objects divided among the pages using them (one unit per page without a
+    size plan), so a page full of images weighs what it costs. The bar
+    stops at 99: the caller still has the last part to store.
+
+    details (stats['progress']) is kept up to date with the phase ('parse',
+    'plan', 'serialize'), part / parts, bytes_done (bytes of the parts
+    serialized), bytes_total (projected from them) and throughput (bytes
+    per second of serialization).
+    """
+
+    def __init__(self, callback, cancelled=None, details=None):
+        self.callback = callback
+        self.cancelled = cancelled
+        self.details = details if details is not None else {}
+        self.percent = 0
+        self.phase = None
+        self.reported = 0.0
+        self.started = time.perf_counter()
+        self.serialize_started = None
+        self.prefix = None  # prefix sums of the page units
+        self.units_total = 0
+        self.units_done = 0
+        self.bytes_done = 0
+        self.parts_done = 0
+        self.parts = 0
+
+    def _report(self, percent, phase, force=False):
+        if self.cancelled and self.cancelled():
+            raise SplitCancelled()
+        percent = max(self.percent, min(int(percent), 99))
+        now = time.perf_counter()
+        throttled = percent == self.percent or now - self.reported < _PROGRESS_INTERVAL
+        if phase == self.phase and throttled and not force:
+            return
+        self.percent, self.phase, self.reported = percent, phase, now
+
+        elapsed = now - self.serialize_started if self.serialize_started is not None else 0.0
+        self.details.update(
+            phase=phase, part=self.parts_done, parts=max(self.parts, self.parts_done),
+            bytes_done=self.bytes_done,
+            bytes_total=(int(self.bytes_done * self.units_total / self.units_done)
+                         if self.units_done else None),
+            throughput=int(self.bytes_done / elapsed) if self.bytes_done and elapsed > 0 else None)
+        if self.callback:
+            self.callback(percent)
+
+    def scanned(self, done, total):
+        self._report(_PARSE_SHARE * 100 * done / total, 'parse')
+
+    def planned(self, ranges, page_objects=None, costs=None, total_pages=0):
+        """The parts to serialize, planned or re-planned; serialization starts here."""
+        if self.prefix is None:
+            if page_objects is not None:
+                users = collections.Counter()
+                for objects in page_objects:
+                    users.update(objects)
+                units = [1 + sum(costs[xref] / users[xref] for xref in objects) for objects in page_objects]
+            else:
+                units = [1] * total_pages
+            self.prefix = [0] + list(itertools.accumulate(units))
+            self.serialize_started = time.perf_counter()
+        self.units_total = sum(self.prefix[last + 1] - self.prefix[first] for first, last in ranges)
+        self.parts = len(ranges)
+        self._report(self.percent, 'plan')
+
+    def serialized(self, first, last, size, parts=1):
+        """Pages first..last came out as parts totalling size bytes."""
+        self.units_done += self.prefix[last + 1] - self.prefix[first]
+        self.bytes_done += size
+        self.parts_done += parts
+        spent = self.serialize_started - self.started
+        elapsed = time.perf_counter() - self.serialize_started
+        projected = elapsed * self.units_total / max(self.units_done, 1)
+        # The last planned part is always reported, so the details end complete
+        self._report(100 * (spent + elapsed) / max(spent + projected, 1e-9), 'serialize',
+                     force=self.units_done >= self.units_total)
+
+    def replanned(self, ranges, replanned):
+        """The same pages were re-planned from ranges into replanned: only the part count changes."""
+        self.parts += len(replanned) - len(ranges)
+
+    def withdrawn(self, first, last, size, parts=1):
+        """Take back a serialization whose parts were dropped, the pages having been re-planned."""
+        self.units_done -= self.prefix[last + 1] - self.prefix[first]
+        self.bytes_done -= size
+        self.parts_done -= parts
+
+
+# Per-process state of the parallel engine. The pool is shared with batch
+# (one set of processes for both); _pool_messages is a queue its processes
+# can post to the parent through, handed to them at start-up
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+_pool_messages = None
+_worker_docs = {}
+
+
+def _logging_config():
+    """The root logger's level and formatter here, for _init_logging in pool processes."""
+    root = logging.getLogger()
+    return root.level, root.handlers[0].formatter if root.handlers else None
+
+
+def _init_logging(level, formatter):
+    """Pool initializer: log like the parent, whose configuration spawn does not carry over."""
+    logging.basicConfig(level=level)
+    if formatter is not None:
+        for handler in logging.getLogger().handlers:
+            handler.setFormatter(formatter)
+
+
+def _init_pool_process(messages, level, formatter):
+    """Pool initializer: keep the parent's message queue and log like it."""
+    global _pool_messages
+    _pool_messages = messages
+    _init_logging(level, formatter)
+
+
+def _get_pool(workers):
+    """
+    Shared process pool, created on first use and reused across jobs and
+    batches. Its processes log at the level the parent had then.
+    """
+    global _pool, _pool_workers, _pool_messages
+    with _pool_lock:
+        # spawn: forking a threaded web worker is not safe
+        context = multiprocessing.get_context("spawn")
+        if _pool_messages is None:
+            _pool_messages = context.Queue()
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                        initializer=_init_pool_process,
+                                        initargs=(_pool_messages, *_logging_config()))
+            _pool_workers = workers
+        return _pool
+
+
+def _drop_pool(pool):
+    """
+    After BrokenProcessPool (a worker died, e.g. OOM-killed): start a fresh
+    pool next time, unless another job has already done so.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+def _split_range_worker(path, first, last, budget, verify, profile_name, recompress):
+    """
+    Runs in a pool process: serialize one planned range of the file at path.
+    Returns (results, carry, recompression report, metrics recorded here);
+    see _emit_range for carry.
+    """
+    doc = _worker_docs.get(path)
+    if doc is None or doc.is_closed:
+        # Keep only the most recent source open in each worker
+        for old in _worker_docs.values():
+            old.close()
+        _worker_docs.clear()
+        doc = fitz.open(path)
+        _worker_docs[path] = doc
+    report, carry = [], {}
+    results = list(_emit_range(doc, first, last, budget, verify, OUTPUT_PROFILES[profile_name],
+                               recompress=recompress, report=report, carry=carry))
+    return results, carry, report, metrics.drain()
+
+
+def _iter_parallel(path, ranges, owners, segments, budget, verify, profile_name, workers, progress,
+                   page_objects, costs, recompress=False, report=None):
+    """
+    Farm the planned ranges out to the process pool and yield the results in
+    order. Only a small window of ranges is in flight so finished parts do
+    not pile up in the parent. When a range carries pages over (see
+    _carry_over), the ranges re-planned after it are submitted again and
+    what was already done for the old ones is dropped.
+    """
+    pool = _get_pool(workers)
+    window = workers * 2
+    # Keyed by (owner, first, last): segments may repeat the same pages
+    futures = {}
+    counted = set()
+    next_submit = 0
+    index = 0
+
+    try:
+        while index < len(ranges):
+            while next_submit < len(ranges) and len(futures) < window:
+                planned = (owners[next_submit],) + ranges[next_submit]
+                if planned not in futures:
+                    futures[planned] = pool.submit(_split_range_worker, path, planned[1], planned[2],
+                                                   budget, verify, profile_name, recompress)
+                next_submit += 1
+
+            current = (owners[index],) + ranges[index]
+            future = futures[current]
+            while not future.done():
+                wait(list(futures.values()), return_when=FIRST_COMPLETED)
+                # Aggregate progress over every finished range, in any order
+                for planned, done_future in futures.items():
+                    if done_future.done() and planned not in counted:
+                        counted.add(planned)
+                        _count_range(progress, done_future)
+
+            if current not in counted:
+                counted.add(current)
+                _count_range(progress, future)
+
+            del futures[current]
+            results, carry, range_report, range_metrics = future.result()
+            metrics.merge(range_metrics)
+            if report is not None:
+                report.extend(range_report)
+            if carry:
+                replanned, owners = _carry_over(ranges, owners, index, carry, page_objects, costs,
+                                                segments, budget)
+                progress.replanned(ranges, replanned)
+                ranges = replanned
+                keep = {(owner,) + planned for owner, planned in zip(owners, ranges)}
+                for planned in [planned for planned in futures if planned not in keep]:
+                    dropped = futures.pop(planned)
+                    if planned in counted:
+                        _count_range(progress, dropped, withdraw=True)
+                    dropped.cancel()
+                next_submit = index + 1
+            for result in results:
+                yield result
+            index += 1
+    except BrokenProcessPool:
+        _drop_pool(pool)
+        raise
+    finally:
+        for future in futures.values():
+            future.cancel()
+
+
+def _count_range(progress, future, withdraw=False):
+    """
+    Credit progress with the pages a pool process serialized (or failed:
+    result() raises later), or take them back with withdraw=True.
+    """
+    if future.done() and not future.cancelled() and future.exception() is None:
+        results = future.result()[0]
+        first, last = results[0][0], results[-1][1]
+        count = progress.withdrawn if withdraw else progress.serialized
+        count(first, last, sum(len(buffer) for _, _, buffer in results), len(results))
+
+
+def _open_source(source):
+    """
+    Open a PDF without copying it into Python memory where possible.
+    Accepts a filesystem path, an mmap, bytes-like objects, BytesIO or a
+    real file object (which is memory-mapped). Returns (doc, path or None).
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source), os.fspath(source)
+    if isinstance(source, mmap.mmap):
+        return fitz.open(stream=memoryview(source), filetype="pdf"), None
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf"), None
+    if isinstance(source, io.BytesIO):
+        return fitz.open(stream=source.getbuffer(), filetype="pdf"), None
+    try:
+        fileno = source.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return fitz.open(stream=source.read(), filetype="pdf"), None
+    mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    return fitz.open(stream=memoryview(mapped), filetype="pdf"), None
+
+
+def _iter_sequential(doc, ranges, owners, segments, budget, verify, profile, page_objects, costs,
+                     progress, recompress=False, report=None):
+    image_cache = {}
+    index = 0
+    while index < len(ranges):
+        first, last = ranges[index]
+        carry = {}
+        for result in _emit_range(doc, first, last, budget, verify, profile, page_objects, costs,
+                                  recompress, image_cache, report, carry):
+            progress.serialized(result[0], result[1], len(result[2]))
+            yield result
+        if carry:
+            replanned, owners = _carry_over(ranges, owners, index, carry, page_objects, costs,
+                                            segments, budget)
+            progress.replanned(ranges, replanned)
+            ranges = replanned
+        index += 1
+
+
+def iter_split_pdf(input_stream, max_size_mb, progress_callback=None, verify=True, workers=None,
+                   profile=DEFAULT_PROFILE, recompress=False, stats=None, strategy=None,
+                   cancelled=None):
+    """
+    Generator version of split_pdf: yields (filename, bytes) for each part as
+    soon as it is serialized, so callers can write it out and drop it before
+    the next part is built.
+
+    The document is planned first: the byte cost of every page (content
+    streams plus the shared objects it references) is computed once and the
+    pages are packed into contiguous ranges against max_size_mb. Only the
+    final parts are serialized. With verify=True, a part that still comes
+    out too big is re-planned with the measured size and split again.
+
+    profile picks one of OUTPUT_PROFILES (fast / balanced / smallest). Costs
+    are estimated under that profile and calibrated on the first part, so
+    the remaining parts are packed against sizes measured the same way.
+
+    recompress=True is an opt-in stage for pages that exceed the limit on
+    their own: their largest images are re-encoded as JPEG (quality ladder,
+    DPI cap) until the page fits. If stats is a dict, the per-page
+    before/after sizes are stored in stats['recompressed'], and the 1-based
+    (first, last) page range of each part, as it is yielded, is appended to
+    stats['pages'].
+
+    progress_callback(percent) follows the phases of the split (see
+    _Progress): it is called on phase changes and at most every
+    _PROGRESS_INTERVAL seconds otherwise, and stops at 99 until the caller
+    has the last part. stats['progress'] holds the phase, part / parts and
+    bytes / throughput as of the last call.
+
+    strategy selects how the document is cut (see STRATEGY_STEPS and
+    parse_strategy), as a list of steps or its text form. The default is
+    size only; "bookmarks+size" first cuts at every top-level bookmark and
+    then keeps each piece under max_size_mb. Without a 'size' step parts
+    have no size limit and max_size_mb is ignored.
+
+    cancelled, if given, is polled on every progress event (every page
+    while planning, every part afterwards), throttled or not; once it
+    returns True the split stops with SplitCancelled.
+
+    input_stream may be a filesystem path (preferred: MuPDF reads it
+    directly), an mmap, bytes or a file-like object; see _open_source. With a
+    path and workers > 1, large documents are serialized by a pool of
+    processes that each open the file themselves.
+    """
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Perfil desconocido: {profile}")
+    profile_name, profile = profile, OUTPUT_PROFILES[profile]
+    strategy, sized, max_size_mb = _resolve_strategy(strategy, max_size_mb)
+
+    progress = _Progress(progress_callback, cancelled,
+                         stats.setdefault('progress', {}) if stats is not None else None)
+    progress.scanned(0, 1)
+
+    logger.debug("Starting split_pdf with max_size_mb=%s, profile=%s, strategy=%s",
+                 max_size_mb, profile_name, strategy)
+
+    with metrics.span('pdf_open'):
+        doc, path = _open_source(input_stream)
+    try:
+        total_pages = len(doc)
+        budget = _budget(sized, max_size_mb)
+
+        logger.debug("PDF has %d pages", total_pages)
+        if total_pages == 0:
+            return
+
+        with metrics.span('plan'):
+            page_objects, costs, blank_pages = _scan_document(
+                doc, profile, progress.scanned, objects=sized,
+                blank=any(name == 'blank' for name, _ in strategy))
+            segments, ranges, owners = _plan(doc, strategy, sized, page_objects, costs, blank_pages,
+                                             budget)
+        progress.planned(ranges, page_objects, costs, total_pages)
+        # Only the pages that end up in parts are worth a process pool
+        total_pages = sum(last - first + 1 for first, last in ranges)
+
+        # Calibrate the estimates on the first part: garbage collection,
+        # subsetting and compression are hard to predict per object
+        first, last = ranges[0]
+        with metrics.span('serialize_part'):
+            first_doc = _import_range(doc, first, last)
+            first_buffer = _save_part(first_doc, profile)
+        if sized and len(ranges) > 1:
+            scale = _calibration(page_objects, costs, first, last, len(first_buffer))
+            if abs(scale - 1) > 0.05:
+                ranges, owners = _plan_segments(page_objects, costs, segments, budget, scale)
+                progress.planned(ranges)
+                logger.debug("Calibrated estimates by %.2f", scale)
+        logger.debug("Planned %d parts", len(ranges))
+
+        report = stats.setdefault('recompressed', []) if stats is not None else None
+        first_results = []
+        if ranges[0] == (first, last):
+            # Already serialized: emit it (or the part of it that fits) from that
+            carry = {}
+            first_results = list(_emit_range(doc, first, last, budget, verify, profile, page_objects,
+                                             costs, recompress, None, report, carry,
+                                             (first_doc, first_buffer)))
+            for result in first_results:
+                progress.serialized(result[0], result[1], len(result[2]))
+            if carry:
+                replanned, owners = _carry_over(ranges, owners, 0, carry, page_objects, costs,
+                                                segments, budget)
+                progress.replanned(ranges, replanned)
+                ranges = replanned
+            ranges, owners = ranges[1:], owners[1:]
+        else:
+            first_doc.close()
+        first_doc = first_buffer = None
+
+        if workers and workers > 1 and path and total_pages >= _PARALLEL_MIN_PAGES and len(ranges) > 1:
+            logger.debug("Serializing with %d processes", workers)
+            results = _iter_parallel(path, ranges, owners, segments, budget, verify, profile_name,
+                                     workers, progress, page_objects, costs, recompress, report)
+        else:
+            results = _iter_sequential(doc, ranges, owners, segments, budget, verify, profile,
+                                       page_objects, costs, progress, recompress, report)
+
+        part_num = 1
+        for first, last, buffer in itertools.chain(first_results, results):
+            if last == first and len(buffer) > budget:
+                logger.warning("Part %d is a single page over the limit (%d bytes)", part_num, len(buffer))
+            else:
+                logger.debug("Saved part %d with %d pages", part_num, last - first + 1)
+            if stats is not None:
+                stats.setdefault('pages', []).append((first + 1, last + 1))
+            yield (f"parte_{part_num:03d}.pdf", buffer)
+            part_num += 1
+
+        logger.debug("Completed splitting into %d parts", part_num - 1)
+    finally:
+        doc.close()
+
+
+def analyze_pdf(input_stream, max_size_mb=None, profile=DEFAULT_PROFILE, strategy=None,
+                calibrate=True):
+    """
+    Predict a split without writing any part: only the planning pass of
+    iter_split_pdf runs (page tree, and the objects each page references
+    with their sizes). Returns a dict with
+
+        pages            page count
+        page_bytes       estimated bytes of each page on its own
+        estimated_bytes  estimated size of the whole document
+        parts            predicted parts: 1-based first_page, last_page
+                         and estimated_bytes; None when neither max_size_mb
+                         nor strategy is given
+
+    With calibrate=True the first predicted part is serialized once, as
+    the split itself does, and the estimates are scaled by what it measured;
+    the boundaries then match the split's plan (only the first part is
+    verified here; a later part that comes out too big is re-split by the
+    split alone).
+    """
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Perfil desconocido: {profile}")
+    profile = OUTPUT_PROFILES[profile]
+    steps = None
+    if max_size_mb or strategy is not None:
+        steps, sized, max_size_mb = _resolve_strategy(strategy, max_size_mb)
+
+    with metrics.span('analyze'):
+        doc, _ = _open_source(input_stream)
+        try:
+            total_pages = len(doc)
+            page_objects, costs, blank_pages = _scan_document(
+                doc, profile, blank=steps is not None and any(name == 'blank' for name, _ in steps))
+            parts = None
+            if steps is not None and total_pages:
+                budget = _budget(sized, max_size_mb)
+                segments, ranges, owners = _plan(doc, steps, sized, page_objects, costs, blank_pages,
+                                                 budget)
+                scale = 1.0
+                if calibrate and sized and len(ranges) > 1:
+                    first, last = ranges[0]
+                    measured = len(_serialize_range(doc, first, last, profile))
+                    scale = _calibration(page_objects, costs, first, last, measured)
+                    if abs(scale - 1) > 0.05:
+                        ranges, owners = _plan_segments(page_objects, costs, segments, budget, scale)
+                    else:
+                        scale = 1.0
+                    if ranges[0] == (first, last) and measured > budget and last > first:
+                        # The split verifies this part, keeps the piece that fits and
+                        # re-plans the rest of its segment
+                        kept = _resplit(page_objects, costs, first, last, budget, measured)[0]
+                        carry = {'first': kept[1] + 1,
+                                 'scale': _measured_scale(page_objects, costs, first, last, measured)}
+                        ranges, owners = _carry_over(ranges, owners, 0, carry, page_objects, costs,
+                                                     segments, budget)
+                parts = [{'first_page': first + 1, 'last_page': last + 1,
+                          'estimated_bytes': int(_estimate_range(page_objects, costs, first, last,
+                                                                 _PART_OVERHEAD) * scale)}
+                         for first, last in ranges]
+        finally:
+            doc.close()
+
+    return {
+        'pages': total_pages,
+        'page_bytes': [sum(costs[xref] for xref in objects) for objects in page_objects],
+        'estimated_bytes': (_estimate_range(page_objects, costs, 0, total_pages - 1, _PART_OVERHEAD)
+                            if total_pages else 0),
+        'parts': parts,
+    }
+
+
+def split_pdf(input_stream, max_size_mb, progress_callback=None, verify=True, workers=None,
+              profile=DEFAULT_PROFILE, recompress=False, stats=None, strategy=None, cancelled=None):
+    """
+    Split PDF using PyMuPDF (fitz) - significantly faster than pypdf.
+    Returns the list of (filename, bytes) parts; see iter_split_pdf.
+    """
+    return list(iter_split_pdf(input_stream, max_size_mb, progress_callback, verify, workers,
+                               profile, recompress, stats, strategy, cancelled))
@@ -0,0 +1,159 @@
+"""
+Command-line splitter for scripted use, without the web server:
+
+    python -m pdfdiv facturas/*.pdf -o partes --max-size 4 --jobs 8
+    python -m pdfdiv "escaneos/**/*.pdf" --strategy blank+size --manifest -
+    cat informe.pdf | python -m pdfdiv - -o partes
+
+Parts are written straight to the output directory as
+"<file>_parte_NNN.pdf" and described in a JSON manifest (pages, bytes and
+checksums per part). Exit status is 1 if any file failed.
+"""
+import os
+import sys
+import glob
+import json
+import logging
+import argparse
+import tempfile
+
+from pdf_logic import iter_split_pdf, parse_strategy, OUTPUT_PROFILES, DEFAULT_PROFILE
+from batch import split_batch, write_parts
+
+
+def expand_inputs(args):
+    """Files, directories (their PDFs) and globs, in order and without repeats; "-" is stdin."""
+    paths = []
+    for arg in args:
+        if arg == '-':
+            matches = ['-']
+        elif os.path.isdir(arg):
+            matches = sorted(glob.glob(os.path.join(arg, '*.pdf')))
+        elif glob.has_magic(arg):
+            matches = sorted(glob.glob(arg, recursive=True))
+            if not matches:
+                raise ValueError(f"Ningún archivo coincide con {arg}")
+        else:
+            if not os.path.isfile(arg):
+                raise ValueError(f"No existe el archivo {arg}")
+            matches = [arg]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def _split_one(name, path, out_dir, max_size_mb, jobs, options):
+    """A single file: split in this process, parallelising its parts instead."""
+    prefix = os.path.splitext(os.path.basename(name))[0] or "documento"
+    stats = {}
+    result = {'name': name, 'status': 'completed', 'parts': [], 'error': None}
+    try:
+        result['parts'] = write_parts(iter_split_pdf(path, max_size_mb, workers=jobs, stats=stats, **options),
+                                      stats, out_dir, prefix)
+    except Exception as e:
+        result.update(status='error', error=str(e))
+    return [result]
+
+
+def build_manifest(files, results, out_dir, max_size_mb, options):
+    entries = []
+    for (_, path), result in zip(files, results):
+        entries.append({
+            'input': path,
+            'status': result['status'],
+            'error': result['error'],
+            'parts': [{
+                'path': os.path.join(out_dir, part['name']),
+                'first_page': part['first_page'],
+                'last_page': part['last_page'],
+                'pages': part['last_page'] - part['first_page'] + 1,
+                'bytes': part['size'],
+                'crc32': part['crc32'],
+                'sha256': part['sha256'],
+            } for part in result['parts']],
+        })
+    return {'max_size_mb': max_size_mb, 'options': options, 'files': entries}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pdfdiv', description="Divide PDFs en partes de tamaño limitado")
+    parser.add_argument('inputs', nargs='+', help="archivos PDF, carpetas o patrones glob; - lee de stdin")
+    parser.add_argument('-o', '--output', default='.', help="carpeta donde escribir las partes")
+    parser.add_argument('-s', '--max-size', type=float, default=4.0, help="tamaño máximo por parte en MB")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="procesos en paralelo (por defecto, uno por núcleo)")
+    parser.add_argument('--profile', choices=sorted(OUTPUT_PROFILES), default=DEFAULT_PROFILE,
+                        help="optimización de las partes")
+    parser.add_argument('--strategy', default='size',
+                        help='cómo dividir, p. ej. "size", "bookmarks+size", "blank+pages:10"')
+    parser.add_argument('--recompress', action='store_true',
+                        help="recomprimir las imágenes de páginas que superen el límite")
+    parser.add_argument('--manifest', help="ruta del manifiesto JSON (por defecto OUTPUT/manifest.json; - para stdout)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="no mostrar el progreso")
+    args = parser.parse_args(argv)
+
+    if args.max_size <= 0 or args.jobs < 1:
+        parser.error("--max-size y --jobs deben ser positivos")
+    try:
+        parse_strategy(args.strategy)
+        paths = expand_inputs(args.inputs)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.ERROR if args.quiet else logging.WARNING,
+                        format="%(levelname)s: %(message)s")
+    os.makedirs(args.output, exist_ok=True)
+    options = {'profile': args.profile, 'strategy': args.strategy, 'recompress': args.recompress}
+
+    def log(message):
+        if not args.quiet:
+            print(message, file=sys.stderr)
+
+    stdin_path = None
+    files = []
+    try:
+        for path in paths:
+            if path == '-':
+                # The pool processes need a file to open
+                fd, stdin_path = tempfile.mkstemp(suffix='.pdf', dir=args.output)
+                with os.fdopen(fd, 'wb') as spool:
+                    spool.write(sys.stdin.buffer.read())
+                files.append(('stdin.pdf', stdin_path))
+            else:
+                files.append((os.path.basename(path), path))
+
+        if len(files) == 1:
+            results = _split_one(files[0][0], files[0][1], args.output, args.max_size, args.jobs, options)
+        else:
+            def progress(results, overall):
+                done = sum(1 for result in results if result['status'] in ('completed', 'error'))
+                log(f"{overall:3d}% ({done}/{len(results)} archivos)")
+
+            results = split_batch(files, args.output, args.max_size, workers=args.jobs,
+                                  progress_callback=progress, **options)
+    finally:
+        if stdin_path:
+            os.remove(stdin_path)
+
+    # Report stdin as "-", not as its spool file
+    inputs = [(name, '-' if path == stdin_path else path) for name, path in files]
+    for (_, path), result in zip(inputs, results):
+        if result['error']:
+            log(f"ERROR {path}: {result['error']}")
+        else:
+            log(f"{path}: {len(result['parts'])} partes")
+
+    manifest = build_manifest(inputs, results, args.output, args.max_size, options)
+    if args.manifest == '-':
+        json.dump(manifest, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.manifest or os.path.join(args.output, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    return 1 if any(result['error'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
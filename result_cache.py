@@ -0,0 +1,107 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+
+def _link_or_copy(src, dst):
+    """Hard link when possible so the cache and the job each own a name."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _link_tree(src_dir, dst_dir):
+    os.makedirs(dst_dir)
+    for entry in os.scandir(src_dir):
+        if entry.is_file():
+            _link_or_copy(entry.path, os.path.join(dst_dir, entry.name))
+
+
+def _dir_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class ResultCache:
+    """
+    Finished split results keyed by (input sha256, max_size, algorithm
+    version, split options), stored as directories of part files (with
+    their manifest) in one directory so every worker on the host shares
+    them. Entries are evicted least recently used first (by mtime) once
+    they add up to more than max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(sha256, max_size, version, options=None):
+        key = f"{sha256}_{max_size:g}_{version}"
+        if options:
+            digest = hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()
+            key += f"_{digest[:12]}"
+        return key
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key, dest):
+        """Place the cached result for key at the directory dest. Returns False on a miss."""
+        path = self._path(key)
+        try:
+            _link_tree(path, dest)
+            os.utime(path)
+        except OSError:
+            shutil.rmtree(dest, ignore_errors=True)
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key, src):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            _link_tree(src, tmp_path)
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another worker stored the same result first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+        self.evict()
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and not entry.name.endswith('.tmp'):
+                yield entry
+
+    def size(self):
+        return sum(_dir_size(entry.path) for entry in self._entries())
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in self._entries():
+            size = _dir_size(entry.path)
+            entries.append((entry.stat().st_mtime, size, entry.path))
+            total += size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {'hits': hits, 'misses': misses, 'bytes': self.size(), 'max_bytes': self.max_bytes}
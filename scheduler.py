@@ -0,0 +1,122 @@
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class JobScheduler:
+    """
+    Fixed pool of worker threads fed from a bounded FIFO queue.
+    submit() refuses work once the queue is full so callers can answer 429
+    instead of piling more splits onto the same CPU. The threads run from
+    start() on; until then jobs only queue up.
+    """
+
+    def __init__(self, workers=2, max_queue=16, default_duration=10.0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue = deque()
+        self._running = {}  # job_id -> start time
+        self._durations = deque(maxlen=20)
+        self._default_duration = default_duration
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads, unless they are already running."""
+        with self._cond:
+            if self._threads:
+                return
+            self._threads = [threading.Thread(target=self._worker, name=f"split-worker-{n}", daemon=True)
+                             for n in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job_id, fn):
+        """Queue fn to run for job_id. Returns False if the queue is full."""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                return False
+            self._queue.append((job_id, fn))
+            self._cond.notify()
+            return True
+
+    def cancel(self, job_id):
+        """Drop job_id from the queue. Returns False if it is not queued (e.g. already running)."""
+        with self._cond:
+            for entry in self._queue:
+                if entry[0] == job_id:
+                    self._queue.remove(entry)
+                    return True
+            return False
+
+    def position(self, job_id):
+        """1-based position in the queue, 0 if running, None if unknown."""
+        with self._cond:
+            if job_id in self._running:
+                return 0
+            for n, (queued_id, _) in enumerate(self._queue):
+                if queued_id == job_id:
+                    return n + 1
+            return None
+
+    def average_duration(self):
+        with self._cond:
+            if not self._durations:
+                return self._default_duration
+            return sum(self._durations) / len(self._durations)
+
+    def eta(self, job_id, progress=0):
+        """
+        Rough seconds until job_id finishes: its own remaining time if it is
+        running, otherwise the time for the jobs ahead of it to drain through
+        the pool plus one average job.
+        """
+        average = self.average_duration()
+        now = time.time()
+        with self._cond:
+            if job_id in self._running:
+                elapsed = now - self._running[job_id]
+                if progress > 0:
+                    return max(0.0, elapsed / progress * (100 - progress))
+                return max(0.0, average - elapsed)
+
+            position = None
+            for n, (queued_id, _) in enumerate(self._queue):
+                if queued_id == job_id:
+                    position = n + 1
+                    break
+            if position is None:
+                return None
+
+            # Wait for a free slot, then for the jobs queued ahead
+            if len(self._running) >= self.workers:
+                first_free = min(max(0.0, average - (now - started))
+                                 for started in self._running.values())
+            else:
+                first_free = 0.0
+            rounds = (position - 1) // self.workers
+            return first_free + rounds * average + average
+
+    def stats(self):
+        with self._cond:
+            return {'queued': len(self._queue), 'running': len(self._running)}
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job_id, fn = self._queue.popleft()
+                self._running[job_id] = time.time()
+
+            try:
+                fn()
+            except Exception:
+                logger.exception("Scheduled job %s failed", job_id)
+            finally:
+                with self._cond:
+                    started = self._running.pop(job_id)
+                    self._durations.append(time.time() - started)
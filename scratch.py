@@ -0,0 +1,229 @@
+import os
+import re
+import time
+import shutil
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Top-level files of the old layout, "<job_id>_<filename>" and friends
+_LEGACY = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_')
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by someone else
+    return True
+
+
+def _tree_size(path):
+    if not os.path.isdir(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # removed while walking
+    return total
+
+
+def _age(path, now):
+    try:
+        return now - os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ScratchArea:
+    """
+    The server's working space on disk, with a byte quota.
+
+    Every job owns one directory, jobs/<job_id>, holding its upload, batch
+    inputs and parts, so removing the job removes all of it. Uploads being
+    received are spooled at the top level as incoming_<pid>_<token>, named
+    after the process writing them so spools left by a crashed worker can
+    be told apart from live ones. Anything else at the top level (the
+    result cache, the job database) is counted but left alone.
+
+    reserve() is the admission check: bytes on disk plus bytes reserved by
+    uploads still arriving must stay within quota and the free disk space.
+    Space an admitted job will need later (its parts) is held under the
+    job's key with hold() until release_hold(), and counts as reserved
+    meanwhile. The measured usage is cached for usage_ttl seconds so a
+    burst of requests does not walk the tree every time.
+    """
+
+    def __init__(self, root, quota_bytes, max_age=3600, usage_ttl=2.0):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.usage_ttl = usage_ttl
+        self._lock = threading.Lock()
+        self._reserved = 0
+        self._holds = {}  # key -> bytes
+        self._usage = None
+        self._measured = 0.0
+        self._last_sweep = None
+        self._swept_files = 0
+        self._swept_bytes = 0
+        os.makedirs(os.path.join(root, 'jobs'), exist_ok=True)
+
+    def job_path(self, job_id):
+        return os.path.join(self.root, 'jobs', job_id)
+
+    def job_dir(self, job_id):
+        """The directory of job_id, created if needed."""
+        path = self.job_path(job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def spool_path(self, token):
+        return os.path.join(self.root, f"incoming_{os.getpid()}_{token}")
+
+    def _measure(self):
+        """Bytes under root by area: jobs, spools and everything else."""
+        usage = {'jobs': 0, 'spools': 0, 'other': 0}
+        for entry in os.scandir(self.root):
+            size = _tree_size(entry.path)
+            if entry.name == 'jobs':
+                usage['jobs'] += size
+            elif entry.name.startswith('incoming_'):
+                usage['spools'] += size
+            else:
+                usage['other'] += size
+        return usage
+
+    def _usage_by_area(self, refresh=False):
+        now = time.time()
+        with self._lock:
+            if not refresh and self._usage is not None and now - self._measured < self.usage_ttl:
+                return self._usage
+        usage = self._measure()
+        with self._lock:
+            self._usage, self._measured = usage, now
+        return usage
+
+    def usage(self, refresh=False):
+        """Bytes on disk under root."""
+        return sum(self._usage_by_area(refresh).values())
+
+    def _room(self, refresh=False):
+        """The lesser of the quota left and the disk space left, before reservations."""
+        used = self.usage(refresh)
+        return min(self.quota_bytes - used, shutil.disk_usage(self.root).free)
+
+    def available(self, refresh=False):
+        """Bytes that may still be written."""
+        room = self._room(refresh)
+        with self._lock:
+            return room - self._reserved - sum(self._holds.values())
+
+    def reserve(self, nbytes, refresh=False):
+        """Claim nbytes for a write about to happen. Returns False if they do not fit."""
+        room = self._room(refresh)
+        with self._lock:
+            if room - self._reserved - sum(self._holds.values()) < nbytes:
+                return False
+            self._reserved += nbytes
+            return True
+
+    def hold(self, key, nbytes):
+        """
+        Keep nbytes reserved for key (a job or upload id) until
+        release_hold(key). Not checked against the quota: callers hold
+        space the request that created key was admitted for.
+        """
+        with self._lock:
+            self._holds[key] = self._holds.get(key, 0) + nbytes
+
+    def release_hold(self, key):
+        with self._lock:
+            if self._holds.pop(key, None) is not None:
+                self._usage = None
+
+    def holds(self):
+        """Keys holding space."""
+        with self._lock:
+            return list(self._holds)
+
+    def release(self, nbytes):
+        with self._lock:
+            self._reserved -= nbytes
+            # What was reserved is on disk now (or gone): measure again
+            self._usage = None
+
+    def sweep(self, job_exists):
+        """
+        Remove what no job or live process owns: spools of dead processes,
+        and spools, job directories without a job (job_exists(job_id) is
+        false) and files of the old layout once older than max_age.
+        Returns (entries removed, bytes freed).
+        """
+        now = time.time()
+        orphans = []
+        for entry in os.scandir(self.root):
+            if entry.name.startswith('incoming_'):
+                pid = entry.name.split('_')[1]
+                dead = pid.isdigit() and not process_alive(int(pid))
+                if dead or _age(entry.path, now) > self.max_age:
+                    orphans.append(entry.path)
+            elif _LEGACY.match(entry.name) and _age(entry.path, now) > self.max_age:
+                orphans.append(entry.path)
+
+        for entry in os.scandir(os.path.join(self.root, 'jobs')):
+            # Checked by age first: a new job's directory precedes its record
+            if _age(entry.path, now) > self.max_age and not job_exists(entry.name):
+                orphans.append(entry.path)
+
+        freed = 0
+        for path in orphans:
+            freed += _tree_size(path)
+            _remove(path)
+        with self._lock:
+            self._last_sweep = now
+            self._swept_files += len(orphans)
+            self._swept_bytes += freed
+            self._usage = None
+        if orphans:
+            logger.info("Swept %d orphaned entries (%d bytes) from %s", len(orphans), freed, self.root)
+        return len(orphans), freed
+
+    def stats(self):
+        usage = self._usage_by_area()
+        disk = shutil.disk_usage(self.root)
+        with self._lock:
+            return {
+                'quota_bytes': self.quota_bytes,
+                'used_bytes': sum(usage.values()),
+                'jobs_bytes': usage['jobs'],
+                'spool_bytes': usage['spools'],
+                'other_bytes': usage['other'],
+                'reserved_bytes': self._reserved,
+                'held_bytes': sum(self._holds.values()),
+                'holds': len(self._holds),
+                'disk_total_bytes': disk.total,
+                'disk_free_bytes': disk.free,
+                'last_sweep': self._last_sweep,
+                'swept_files': self._swept_files,
+                'swept_bytes': self._swept_bytes,
+            }
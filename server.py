@@ -1,120 +1,1058 @@
 import os
-import io
-import zipfile
+import shutil
 import uuid
 import time
+import json
+import hashlib
+import logging
+import zipfile
+import functools
 import threading
-from flask import Flask, request, send_file, render_template, jsonify, Response
+from flask import Flask, Request, request, render_template, jsonify, Response, send_file
+from werkzeug.datastructures import ContentRange
+from werkzeug.http import parse_range_header, parse_if_range_header
 from werkzeug.utils import secure_filename
-from pdf_logic import split_pdf
+from pdf_logic import (iter_split_pdf, analyze_pdf, parse_strategy, parse_max_size, SplitCancelled,
+                       ALGORITHM_VERSION, OUTPUT_PROFILES, DEFAULT_PROFILE)
+from scheduler import JobScheduler
+from job_store import MemoryJobStore, SQLiteJobStore
+from result_cache import ResultCache
+from chunked_upload import ChunkedUpload
+from zipstream import StoredZip
+from batch import split_batch, write_parts
+from scratch import ScratchArea, process_alive
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class HashingSpoolFile:
+    """
+    Upload spool file written straight into UPLOAD_FOLDER, hashing the bytes
+    as werkzeug parses them. The upload can then be renamed into place
+    instead of being copied out of a temporary file and read back.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sha256 = hashlib.sha256()
+        self._file = open(path, 'w+b')
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpoolFile(scratch.spool_path(uuid.uuid4().hex))
+
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB limit
 app.config['UPLOAD_FOLDER'] = 'temp_uploads'
+# Chunk size suggested to clients of the resumable upload API
+app.config['UPLOAD_CHUNK_SIZE'] = 4 * 1024 * 1024
+# Progress streams send at most one event per interval, plus keep-alives
+app.config['PROGRESS_EVENT_INTERVAL'] = 0.25
+app.config['PROGRESS_KEEPALIVE'] = 15
+# Processes used to serialize parts of large PDFs (1 = in the request thread)
+app.config['SPLIT_PROCESSES'] = int(os.environ.get('SPLIT_PROCESSES', os.cpu_count() or 1))
+# Jobs split at the same time, and jobs allowed to wait for a slot
+app.config['SPLIT_WORKERS'] = int(os.environ.get('SPLIT_WORKERS', 2))
+app.config['SPLIT_QUEUE_SIZE'] = int(os.environ.get('SPLIT_QUEUE_SIZE', 16))
+# 'memory' for a single worker, 'sqlite' to share jobs between workers on one host
+app.config['JOB_STORE'] = os.environ.get('JOB_STORE', 'memory')
+# Finished jobs expire after JOB_TTL seconds; results are evicted LRU above JOB_RESULTS_MB
+app.config['JOB_TTL'] = int(os.environ.get('JOB_TTL', 3600))
+app.config['JOB_RESULTS_MB'] = int(os.environ.get('JOB_RESULTS_MB', 512))
+# Archives kept for repeated uploads of the same file with the same limit
+app.config['RESULT_CACHE_MB'] = int(os.environ.get('RESULT_CACHE_MB', 256))
+# Jobs still splitting JOB_TIMEOUT seconds after they started are cancelled;
+# under gunicorn (server:app) keep it below --timeout so a stuck job cannot
+# take the worker, and every other job on it, down
+app.config['JOB_TIMEOUT'] = int(os.environ.get('JOB_TIMEOUT', 240))
+# How often a running job re-reads the store for a cancel request
+app.config['CANCEL_POLL_INTERVAL'] = 0.5
+# Files accepted in one POST /batch (loose PDFs or inside a ZIP)
+app.config['BATCH_MAX_FILES'] = int(os.environ.get('BATCH_MAX_FILES', 500))
+# Disk budget for everything under UPLOAD_FOLDER; uploads that would not
+# fit are refused with 507 until jobs expire
+app.config['SCRATCH_QUOTA_MB'] = int(os.environ.get('SCRATCH_QUOTA_MB', 2048))
+# Files no job or live worker owns are removed once SCRATCH_MAX_AGE seconds
+# old, by a sweep every SWEEP_INTERVAL seconds (and one at startup)
+app.config['SCRATCH_MAX_AGE'] = int(os.environ.get('SCRATCH_MAX_AGE', app.config['JOB_TTL']))
+app.config['SWEEP_INTERVAL'] = int(os.environ.get('SWEEP_INTERVAL', 60))
+# DEBUG logs every planned and saved part; disabled levels cost nothing
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
 
-# In-memory job storage (Note: in production with multiple workers, 
-# you'd use Redis or similar. For Koyeb 1-worker, this is OK)
-jobs = {}
+logging.basicConfig(level=app.config['LOG_LEVEL'],
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+scratch = ScratchArea(app.config['UPLOAD_FOLDER'],
+                      quota_bytes=app.config['SCRATCH_QUOTA_MB'] * 1024 * 1024,
+                      max_age=app.config['SCRATCH_MAX_AGE'])
+
+if app.config['JOB_STORE'] == 'sqlite':
+    store = SQLiteJobStore(os.path.join(app.config['UPLOAD_FOLDER'], 'jobs.sqlite3'),
+                           ttl=app.config['JOB_TTL'],
+                           max_result_bytes=app.config['JOB_RESULTS_MB'] * 1024 * 1024)
+else:
+    store = MemoryJobStore(ttl=app.config['JOB_TTL'],
+                           max_result_bytes=app.config['JOB_RESULTS_MB'] * 1024 * 1024)
+
+cache = ResultCache(os.path.join(app.config['UPLOAD_FOLDER'], 'cache'),
+                    max_bytes=app.config['RESULT_CACHE_MB'] * 1024 * 1024)
+
+# Resumable uploads in progress. Kept in this process: with several workers
+# the chunks of one upload must reach the same worker (sticky sessions).
+uploads = {}
+uploads_lock = threading.Lock()
+
+# Woken on every job state change so progress streams can push it
+progress_changed = threading.Condition()
+
+scheduler = JobScheduler(workers=app.config['SPLIT_WORKERS'],
+                         max_queue=app.config['SPLIT_QUEUE_SIZE'])
+
+metrics.gauge('active_jobs', "Jobs being split right now.", lambda: scheduler.stats()['running'])
+metrics.gauge('queue_depth', "Jobs waiting for a split worker.", lambda: scheduler.stats()['queued'])
+metrics.gauge('job_result_bytes', "Bytes of finished results held for jobs.", store.total_result_bytes)
+metrics.gauge('temp_dir_bytes', "Bytes used under UPLOAD_FOLDER.", scratch.usage)
+metrics.gauge('temp_dir_available_bytes', "Bytes uploads may still use under SCRATCH_QUOTA_MB.",
+              scratch.available)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def _discard_spools(files=None):
+    """Remove the spool files of an upload that were not moved into place."""
+    if files is None:
+        files = [file for _, file in request.files.items(multi=True)]
+    for file in files:
+        file.stream.close()
+        if os.path.exists(file.stream.path):
+            os.remove(file.stream.path)
+
+def _scratch_full():
+    """(body, status, headers) for an upload refused by admission control."""
+    return ({"error": "No queda espacio en el servidor, inténtalo más tarde"}, 507,
+            {'Retry-After': str(app.config['SWEEP_INTERVAL'])})
+
+def _upload_reservation(content_length):
+    """
+    Scratch bytes an upload of content_length bytes is admitted against:
+    the file and the parts it will be split into. An unknown length counts
+    as MAX_CONTENT_LENGTH. Once the file is on disk the parts' share stays
+    held by its job (_hold_parts) until the job ends.
+    """
+    limit = app.config['MAX_CONTENT_LENGTH']
+    return 2 * min(int(content_length or limit), limit)
+
+def _reserve_scratch(nbytes):
+    """Reserve nbytes of scratch space, expiring old jobs first if they do not fit."""
+    if scratch.reserve(nbytes):
+        return True
+    store.evict()
+    _evict_uploads()
+    return scratch.reserve(nbytes, refresh=True)
+
+def _hold_parts(job_id, path):
+    """Hold scratch space for the parts of job_id: about the size of its input at path."""
+    if os.path.isdir(path):
+        size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    else:
+        size = os.path.getsize(path)
+    scratch.hold(job_id, size)
+
+def _release_holds():
+    """Release the space held for jobs that have ended, expired or been deleted elsewhere."""
+    for key in scratch.holds():
+        if key in uploads:
+            continue
+        job = store.get(key)
+        if job is None or job['status'] in _FINAL_STATUSES:
+            scratch.release_hold(key)
+
+def _admitted(view):
+    """Answer 507 instead of receiving a multipart upload the scratch area has no room for."""
+    @functools.wraps(view)
+    def admitted(*args, **kwargs):
+        if request.mimetype != 'multipart/form-data':
+            return view(*args, **kwargs)
+        nbytes = _upload_reservation(request.content_length)
+        if not _reserve_scratch(nbytes):
+            body, status, headers = _scratch_full()
+            return jsonify(body), status, headers
+        try:
+            return view(*args, **kwargs)
+        finally:
+            scratch.release(nbytes)
+    return admitted
+
+def _upload_name(filename):
+    """Filename an upload is saved under in its job directory; never empty."""
+    # secure_filename drops whatever is not ASCII: "报告.pdf" -> "pdf", ".." -> ""
+    return secure_filename(filename) or 'documento.pdf'
+
+def _accept_upload(filename, spool, form):
+    """
+    Turn the HashingSpoolFile of a finished upload into a job.
+    Returns (body, status); shared with the ASGI front end.
+    """
+    job_id = str(uuid.uuid4())
+    filename = _upload_name(filename)
+    filepath = os.path.join(scratch.job_dir(job_id), filename)
+    # The spool file was hashed while the request was parsed, so a repeated
+    # upload can be answered from the cache without splitting again
+    with metrics.span('upload_save'):
+        spool.close()
+        os.replace(spool.path, filepath)
+    
+    try:
+        max_size = parse_max_size(form.get('max_size', 4.0))
+        options = _split_options(form)
+    except ValueError as e:
+        shutil.rmtree(scratch.job_path(job_id), ignore_errors=True)
+        return {"error": str(e)}, 400
+    return _create_job(job_id, filepath, filename, max_size, spool.sha256.hexdigest(), options), 200
+
 @app.route('/upload', methods=['POST'])
+@_admitted
 def upload():
     if 'pdf_file' not in request.files:
+        _discard_spools()
         return jsonify({"error": "No hay archivo"}), 400
     
     file = request.files['pdf_file']
     if file.filename == '':
+        _discard_spools()
         return jsonify({"error": "No se ha seleccionado archivo"}), 400
     
-    job_id = str(uuid.uuid4())
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{filename}")
-    file.save(filepath)
+    body, status = _accept_upload(file.filename, file.stream, request.form)
+    _discard_spools()
+    return jsonify(body), status
+
+def _parts_dir(job_id):
+    return os.path.join(scratch.job_path(job_id), 'parts')
+
+def _read_manifest(parts_dir):
+    with open(os.path.join(parts_dir, 'manifest.json')) as f:
+        return json.load(f)
+
+def _append_parts(parts_dir, parts):
+    """
+    Record finished parts in parts.jsonl while the job runs, one line per
+    part, so they can be downloaded before manifest.json is written.
+    """
+    with open(os.path.join(parts_dir, 'parts.jsonl'), 'a') as f:
+        for part in parts:
+            f.write(json.dumps(part) + "\n")
+
+def _named_parts(job, parts):
+    """
+    Manifest entries as the user sees them: 'file' is the name on disk and
+    'name' the one to download it as. A single upload's parts are stored
+    as parte_NNN.pdf, so a cached result carries no uploader's filename,
+    and get this job's filename here; batch parts already carry the name
+    of the file they come from.
+    """
+    if job.get('files') is not None:
+        return [dict(part, file=part['name']) for part in parts]
+    base_name = os.path.splitext(job['filename'])[0]
+    return [dict(part, file=part['name'], name=f"{base_name}_{part['name']}") for part in parts]
+
+def _job_parts(job_id, job):
+    """Parts of a job that can be downloaded so far (see _named_parts), with the directory holding them."""
+    if job['status'] == 'completed' and job['result_path']:
+        return job['result_path'], _named_parts(job, _read_manifest(job['result_path'])['parts'])
+    parts_dir = _parts_dir(job_id)
+    if job['status'] != 'processing':
+        return parts_dir, []
+    try:
+        with open(os.path.join(parts_dir, 'parts.jsonl')) as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return parts_dir, []
+    # A line still being written has no newline yet
+    return parts_dir, _named_parts(job, [json.loads(line) for line in lines if line.endswith("\n")])
+
+def _split_options(data):
+    """Split options (besides max_size) requested with an upload."""
+    profile = data.get('profile') or DEFAULT_PROFILE
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Perfil desconocido: {profile}")
+    # JSON sends a boolean, a form checkbox sends "on"
+    recompress = data.get('recompress') in (True, 'on', 'true', '1')
+    # Kept in text form; parsed here only to reject it before the upload
+    strategy = data.get('strategy') or 'size'
+    parse_strategy(strategy)
+    return {'profile': profile, 'recompress': recompress, 'strategy': strategy}
+
+def _create_job(job_id, filepath, filename, max_size, sha256, options):
+    """Register an uploaded file as a job, completing it at once on a cache hit."""
+    cache_key = ResultCache.key(sha256, max_size, ALGORITHM_VERSION, options)
     
-    jobs[job_id] = {
+    store.evict()
+    result_path = _parts_dir(job_id)
+    if cache.get(cache_key, result_path):
+        os.remove(filepath)
+        store.create(job_id, {
+            'status': 'uploaded',
+            'progress': 100,
+            'filename': filename,
+            'filepath': None,
+            'result_path': None,
+            'job_dir': scratch.job_path(job_id),
+            'max_size': max_size,
+            'options': options,
+            'cache_key': cache_key
+        })
+        store.update(job_id, status='completed', result_path=result_path,
+                     recompressed=_read_manifest(result_path).get('recompressed', []))
+        return {"job_id": job_id, "cached": True}
+    
+    _hold_parts(job_id, filepath)
+    store.create(job_id, {
         'status': 'uploaded',
         'progress': 0,
         'filename': filename,
         'filepath': filepath,
-        'result': None,
-        'max_size': float(request.form.get('max_size', 4.0))
-    }
+        'result_path': None,
+        'job_dir': scratch.job_path(job_id),
+        'max_size': max_size,
+        'options': options,
+        'cache_key': cache_key
+    })
     
-    return jsonify({"job_id": job_id})
+    return {"job_id": job_id}
+
+def _evict_uploads():
+    cutoff = time.time() - app.config['JOB_TTL']
+    with uploads_lock:
+        stale = [upload_id for upload_id, upload in uploads.items() if upload.updated < cutoff]
+        stale = [(upload_id, uploads.pop(upload_id)) for upload_id in stale]
+    for upload_id, upload in stale:
+        scratch.release_hold(upload_id)
+        upload.discard()
+
+@app.route('/upload/init', methods=['POST'])
+def upload_init():
+    data = request.get_json(silent=True) or request.form
+    if not data.get('filename'):
+        return jsonify({"error": "No se ha seleccionado archivo"}), 400
+    filename = _upload_name(data['filename'])
+    try:
+        size = int(data.get('size', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Parámetros inválidos"}), 400
+    try:
+        max_size = parse_max_size(data.get('max_size', 4.0))
+        options = _split_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if size <= 0:
+        return jsonify({"error": "Archivo vacío"}), 400
+    if size > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({"error": "Archivo demasiado grande"}), 413
+    
+    _evict_uploads()
+    # The spool is allocated at full size up front, so once it exists the
+    # measured usage covers it
+    nbytes = _upload_reservation(size)
+    if not _reserve_scratch(nbytes):
+        body, status, headers = _scratch_full()
+        return jsonify(body), status, headers
+    upload_id = str(uuid.uuid4())
+    try:
+        upload = ChunkedUpload(scratch.spool_path(upload_id), size, filename, max_size, options)
+        scratch.hold(upload_id, size)
+    finally:
+        scratch.release(nbytes)
+    with uploads_lock:
+        uploads[upload_id] = upload
+    
+    return jsonify({"upload_id": upload_id, "chunk_size": app.config['UPLOAD_CHUNK_SIZE']})
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    upload = uploads.get(upload_id)
+    if not upload:
+        return jsonify({"error": "Subida no encontrada"}), 404
+    return jsonify({"size": upload.size, "received": upload.received()})
+
+@app.route('/upload/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    upload = uploads.get(upload_id)
+    if not upload:
+        return jsonify({"error": "Subida no encontrada"}), 404
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        with metrics.span('upload_save'):
+            upload.write(offset, request.stream)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"received": upload.received_bytes()})
+
+@app.route('/upload/<upload_id>/complete', methods=['POST'])
+def upload_complete(upload_id):
+    upload = uploads.get(upload_id)
+    if not upload:
+        return jsonify({"error": "Subida no encontrada"}), 404
+    if not upload.is_complete():
+        return jsonify({"error": "Subida incompleta", "received": upload.received()}), 409
+    with uploads_lock:
+        if uploads.pop(upload_id, None) is None:
+            return jsonify({"error": "Subida no encontrada"}), 404
+    # From here on no chunk still in flight can change the file, so the
+    # digest (the result cache key) stays that of what gets split
+    sha256 = upload.finish()
+    
+    job_id = str(uuid.uuid4())
+    filepath = os.path.join(scratch.job_dir(job_id), _upload_name(upload.filename))
+    os.replace(upload.path, filepath)
+    try:
+        return jsonify(_create_job(job_id, filepath, upload.filename, upload.max_size,
+                                   sha256, upload.options))
+    finally:
+        scratch.release_hold(upload_id)
+
+def _update_job(job_id, **fields):
+    store.update(job_id, **fields)
+    with progress_changed:
+        progress_changed.notify_all()
+
+def _job_cancelled(job_id, deadline):
+    """
+    cancelled() callable for a running job: true once it is past deadline
+    or DELETE /jobs/<job_id> asked for it. The store may be shared on disk,
+    so it is read at most every CANCEL_POLL_INTERVAL seconds.
+    """
+    state = {'next_check': 0.0, 'cancelled': False}
+
+    def cancelled():
+        now = time.time()
+        if now >= deadline:
+            state['cancelled'] = True
+        elif not state['cancelled'] and now >= state['next_check']:
+            state['next_check'] = now + app.config['CANCEL_POLL_INTERVAL']
+            job = store.get(job_id)
+            state['cancelled'] = job is None or job.get('cancel_requested', False)
+        return state['cancelled']
+    return cancelled
+
+def _remove_input(path):
+    if path and os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif path and os.path.exists(path):
+        os.remove(path)
+
+def _end_cancelled(job_id, deadline, input_path):
+    """Record why a job stopped with SplitCancelled, then remove its files."""
+    if time.time() >= deadline:
+        logger.warning("Job %s exceeded JOB_TIMEOUT", job_id)
+        _update_job(job_id, status='error', filepath=None,
+                    error_msg="El procesamiento superó el tiempo máximo")
+    else:
+        logger.info("Job %s cancelled", job_id)
+        _update_job(job_id, status='cancelled', filepath=None)
+    shutil.rmtree(_parts_dir(job_id), ignore_errors=True)
+    _remove_input(input_path)
+
+# Statuses after which a job's progress stream ends
+_FINAL_STATUSES = ('completed', 'error', 'cancelled')
+
+def _progress_state(payload):
+    # The ETA alone drifts every second; only real changes are sent
+    return (payload['status'], payload['progress'], payload['phase'], payload['part'],
+            payload['queue_position'], payload['error'])
+
+def _progress_payload(job_id, job):
+    eta = None
+    if job['status'] in ('queued', 'processing'):
+        eta = scheduler.eta(job_id, job['progress'])
+    # Phase of a running job (parse, plan, serialize, archive) and the
+    # bytes of the parts written so far
+    details = job.get('details') or {}
+    return {
+        'status': job['status'],
+        'progress': job['progress'],
+        'phase': details.get('phase') if job['status'] == 'processing' else None,
+        'part': details.get('part'),
+        'parts': details.get('parts'),
+        'bytes_done': details.get('bytes_done'),
+        'bytes_total': details.get('bytes_total'),
+        'throughput': details.get('throughput'),
+        'queue_position': scheduler.position(job_id) if eta is not None else None,
+        'eta': round(eta, 1) if eta is not None else None,
+        'recompressed': job.get('recompressed', []),
+        'files': job.get('files'),
+        'error': job.get('error_msg')
+    }
 
 @app.route('/progress/<job_id>')
 def progress(job_id):
-    job = jobs.get(job_id)
+    job = store.get(job_id)
     if not job:
         return jsonify({"error": "Job no encontrado"}), 404
     
-    return jsonify({
-        'status': job['status'],
-        'progress': job['progress'],
-        'error': job.get('error_msg')
-    })
+    return jsonify(_progress_payload(job_id, job))
+
+@app.route('/progress/<job_id>/stream')
+def progress_stream(job_id):
+    if not store.get(job_id):
+        return jsonify({"error": "Job no encontrado"}), 404
+    
+    interval = app.config['PROGRESS_EVENT_INTERVAL']
+    keepalive = app.config['PROGRESS_KEEPALIVE']
+    
+    def events():
+        last_state = None
+        last_sent = time.time()
+        while True:
+            job = store.get(job_id)
+            if job is None:
+                yield f"data: {json.dumps({'status': 'error', 'error': 'Job no encontrado'})}\n\n"
+                return
+            payload = _progress_payload(job_id, job)
+            state = _progress_state(payload)
+            if state != last_state:
+                last_state = state
+                last_sent = time.time()
+                yield f"data: {json.dumps(payload)}\n\n"
+                if payload['status'] in _FINAL_STATUSES:
+                    return
+                # Coalesce bursts of updates into one event per interval
+                time.sleep(interval)
+            elif time.time() - last_sent >= keepalive:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            
+            # Other workers sharing the store cannot notify us: wake up
+            # regularly and re-read it anyway
+            with progress_changed:
+                progress_changed.wait(timeout=1)
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/process/<job_id>', methods=['POST'])
 def process(job_id):
-    job = jobs.get(job_id)
+    job = store.get(job_id)
     if not job:
         return jsonify({"error": "Job no encontrado"}), 404
     
     def run_split():
+        deadline = time.time() + app.config['JOB_TIMEOUT']
         try:
-            job['status'] = 'processing'
+            _update_job(job_id, status='processing')
+            stats = {}
             
             def update_progress(p):
-                job['progress'] = p
+                # Called on changes only, at most every few tenths of a second
+                _update_job(job_id, progress=p, details=dict(stats['progress']))
                 
-            with open(job['filepath'], 'rb') as f:
-                input_stream = io.BytesIO(f.read())
-                parts = split_pdf(input_stream, job['max_size'], progress_callback=update_progress)
-            
-            # Create ZIP in memory
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                base_name = os.path.splitext(job['filename'])[0]
-                for filename, content in parts:
-                    zip_file.writestr(f"{base_name}_{filename}", content)
+            # Each part is written to its own file as soon as it is finished,
+            # so only one part is held in memory at a time. The ZIP is
+            # assembled from these files at download time, under this
+            # job's filename (_named_parts)
+            result_path = _parts_dir(job_id)
+            os.makedirs(result_path)
+            # The saved upload is opened by path so the pool processes can
+            # read it too
+            split = iter_split_pdf(job['filepath'], job['max_size'],
+                                   progress_callback=update_progress,
+                                   workers=app.config['SPLIT_PROCESSES'],
+                                   stats=stats,
+                                   cancelled=_job_cancelled(job_id, deadline),
+                                   **job['options'])
+            manifest = write_parts(split, stats, result_path,
+                                   on_part=lambda part: _append_parts(result_path, [part]))
             
-            job['result'] = zip_buffer.getvalue()
-            job['status'] = 'completed'
-            job['progress'] = 100
+            # Manifest (the ZIP is streamed from it), cache and cleanup
+            _update_job(job_id, details=dict(stats['progress'], phase='archive'))
+            with open(os.path.join(result_path, 'manifest.json'), 'w') as f:
+                json.dump({'parts': manifest, 'recompressed': stats.get('recompressed', [])}, f)
             
             # Cleanup temp file
             if os.path.exists(job['filepath']):
                 os.remove(job['filepath'])
+            
+            _update_job(job_id, result_path=result_path, filepath=None,
+                         recompressed=stats.get('recompressed', []),
+                         status='completed', progress=100)
+            cache.put(job['cache_key'], result_path)
+            store.evict()
                 
+        except SplitCancelled:
+            _end_cancelled(job_id, deadline, job['filepath'])
         except Exception as e:
-            job['status'] = 'error'
-            job['error_msg'] = str(e)
-            print(f"ERROR in job {job_id}: {str(e)}")
+            _update_job(job_id, status='error', error_msg=str(e))
+            logger.exception("Job %s failed", job_id)
+            # Drop the parts written so far
+            shutil.rmtree(_parts_dir(job_id), ignore_errors=True)
+        finally:
+            # The parts are on disk now, or will not be
+            scratch.release_hold(job_id)
+
+    # Only one request gets to queue the job, even across workers: the
+    # others (and any once it has left 'uploaded') get its status. owner
+    # lets another worker sharing the store tell if this one died
+    if not store.update_if(job_id, 'uploaded', status='queued', owner=os.getpid()):
+        job = store.get(job_id)
+        if not job:
+            return jsonify({"error": "Job no encontrado"}), 404
+        return jsonify({"error": "El trabajo ya no está pendiente", "status": job['status']}), 409
+    with progress_changed:
+        progress_changed.notify_all()
+    if not scheduler.submit(job_id, run_split):
+        _update_job(job_id, status='uploaded')
+        retry_after = int(scheduler.average_duration()) + 1
+        return jsonify({"error": "Servidor ocupado, inténtalo más tarde"}), 429, {'Retry-After': str(retry_after)}
+    return jsonify({"status": "queued", "queue_position": scheduler.position(job_id)})
+
+def _save_batch_files(files, input_dir):
+    """
+    Move the uploaded PDFs of a batch into input_dir, extracting the PDFs
+    of any ZIP. Returns [(name, path)] in upload order.
+    """
+    inputs = []
+    extracted = 0
+
+    def target(name):
+        if len(inputs) >= app.config['BATCH_MAX_FILES']:
+            raise ValueError(f"Demasiados archivos (máximo {app.config['BATCH_MAX_FILES']})")
+        return os.path.join(input_dir, f"{len(inputs):04d}_{secure_filename(name) or 'documento.pdf'}")
+
+    for file in files:
+        spool = file.stream
+        spool.close()
+        if not file.filename.lower().endswith('.zip'):
+            path = target(file.filename)
+            os.replace(spool.path, path)
+            inputs.append((os.path.basename(file.filename), path))
+            continue
+        with zipfile.ZipFile(spool.path) as archive:
+            for info in archive.infolist():
+                name = info.filename
+                if info.is_dir() or not name.lower().endswith('.pdf') or name.startswith('__MACOSX/'):
+                    continue
+                # The upload limit also applies to what the ZIP expands to
+                extracted += info.file_size
+                if extracted > app.config['MAX_CONTENT_LENGTH']:
+                    raise ValueError("El ZIP descomprimido supera el tamaño máximo")
+                path = target(os.path.basename(name))
+                with archive.open(info) as src, open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                inputs.append((os.path.basename(name), path))
+    return inputs
+
+def _batch_files(results):
+    """Per-file state of a batch as shown by /progress."""
+    return [{'name': result['name'], 'status': result['status'], 'progress': result['progress'],
+             'parts': len(result['parts']), 'error': result['error']} for result in results]
+
+def _start_batch(files, form):
+    """
+    Queue a batch job for the uploaded files (each with a filename and a
+    HashingSpoolFile stream) and form fields. Returns (body, status,
+    headers); the caller discards the spools afterwards.
+    """
+    if not files:
+        return {"error": "No hay archivos"}, 400, {}
+    
+    job_id = str(uuid.uuid4())
+    input_dir = os.path.join(scratch.job_dir(job_id), 'batch')
+    os.makedirs(input_dir)
+    try:
+        max_size = parse_max_size(form.get('max_size', 4.0))
+        options = _split_options(form)
+        with metrics.span('upload_save'):
+            inputs = _save_batch_files(files, input_dir)
+        if not inputs:
+            raise ValueError("No hay archivos PDF en la subida")
+    except zipfile.BadZipFile:
+        shutil.rmtree(scratch.job_path(job_id), ignore_errors=True)
+        return {"error": "El archivo ZIP no es válido"}, 400, {}
+    except ValueError as e:
+        shutil.rmtree(scratch.job_path(job_id), ignore_errors=True)
+        return {"error": str(e)}, 400, {}
+    
+    # A single ZIP names the result; loose files are a "lote"
+    archive_name = files[0].filename if len(files) == 1 and files[0].filename.lower().endswith('.zip') else 'lote'
+    results = [{'name': name, 'status': 'queued', 'progress': 0, 'parts': [], 'error': None}
+               for name, _ in inputs]
+    _hold_parts(job_id, input_dir)
+    store.evict()
+    store.create(job_id, {
+        'status': 'queued',
+        'progress': 0,
+        'filename': secure_filename(archive_name) or 'lote',
+        'filepath': input_dir,
+        'result_path': None,
+        'job_dir': scratch.job_path(job_id),
+        'max_size': max_size,
+        'options': options,
+        'cache_key': None,
+        'files': _batch_files(results),
+        'owner': os.getpid()
+    })
+    
+    def run_batch():
+        deadline = time.time() + app.config['JOB_TIMEOUT']
+        try:
+            _update_job(job_id, status='processing')
+            started = time.time()
+            last_update = [0.0]
+            published = set()
+            
+            def batch_details(results, phase):
+                # Bytes count the parts of the files finished so far
+                parts = [part for result in results for part in result['parts']]
+                done = sum(part['size'] for part in parts)
+                elapsed = time.time() - started
+                return {'phase': phase, 'part': len(parts), 'parts': None, 'bytes_done': done,
+                        'bytes_total': None, 'throughput': int(done / elapsed) if elapsed > 0 else None}
+            
+            def update_progress(results, overall):
+                # Parts of each finished file can be fetched right away
+                for index, result in enumerate(results):
+                    if result['status'] == 'completed' and index not in published:
+                        published.add(index)
+                        _append_parts(result_path, result['parts'])
+                # Throttled: a batch may have hundreds of files
+                now = time.time()
+                if now - last_update[0] >= app.config['PROGRESS_EVENT_INTERVAL']:
+                    last_update[0] = now
+                    _update_job(job_id, progress=overall, files=_batch_files(results),
+                                details=batch_details(results, 'serialize'))
+            
+            result_path = _parts_dir(job_id)
+            os.makedirs(result_path)
+            results = split_batch(inputs, result_path, max_size,
+                                  workers=app.config['SPLIT_PROCESSES'],
+                                  progress_callback=update_progress,
+                                  cancelled=_job_cancelled(job_id, deadline), **options)
+            parts = [part for result in results for part in result['parts']]
+            if not parts:
+                # Files without pages fail with no error of their own
+                errors = [f"{result['name']}: {result['error']}" for result in results if result['error']]
+                raise ValueError("No se pudo dividir ningún archivo: " + ("; ".join(errors) or "sin páginas"))
+            recompressed = [dict(entry, file=result['name'])
+                            for result in results for entry in result['recompressed']]
+            _update_job(job_id, details=batch_details(results, 'archive'))
+            with open(os.path.join(result_path, 'manifest.json'), 'w') as f:
+                json.dump({'parts': parts, 'recompressed': recompressed}, f)
+            
+            shutil.rmtree(input_dir, ignore_errors=True)
+            _update_job(job_id, result_path=result_path, filepath=None, files=_batch_files(results),
+                         recompressed=recompressed, status='completed', progress=100)
+            store.evict()
+            
+        except SplitCancelled:
+            _end_cancelled(job_id, deadline, input_dir)
+        except Exception as e:
+            _update_job(job_id, status='error', error_msg=str(e))
+            logger.exception("Batch %s failed", job_id)
+            shutil.rmtree(_parts_dir(job_id), ignore_errors=True)
+        finally:
+            scratch.release_hold(job_id)
+    
+    if not scheduler.submit(job_id, run_batch):
+        store.delete(job_id)
+        scratch.release_hold(job_id)
+        retry_after = int(scheduler.average_duration()) + 1
+        return {"error": "Servidor ocupado, inténtalo más tarde"}, 429, {'Retry-After': str(retry_after)}
+    return {"job_id": job_id, "status": "queued", "files": len(inputs),
+            "queue_position": scheduler.position(job_id)}, 200, {}
+
+@app.route('/batch', methods=['POST'])
+@_admitted
+def batch():
+    files = [file for file in request.files.getlist('pdf_files') if file.filename]
+    try:
+        body, status, headers = _start_batch(files, request.form)
+    finally:
+        _discard_spools()
+    return jsonify(body), status, headers
+
+def _analyze_request(data, file):
+    """
+    Split-plan preview for /analyze: of the upload of job_id in data, or of
+    file (the uploaded pdf_file, may be None). Returns (body, status); the
+    caller discards the spool.
+    """
+    job_id = data.get('job_id')
+    if job_id:
+        job = store.get(job_id)
+        if not job or not job['filepath'] or not os.path.isfile(job['filepath']):
+            return {"error": "Job no encontrado"}, 404
+        path, default_max_size = job['filepath'], job['max_size']
+    elif file is not None and file.filename:
+        file.stream.close()
+        path, default_max_size = file.stream.path, 4.0
+    else:
+        return {"error": "No hay archivo"}, 400
+    
+    try:
+        max_size = parse_max_size(data.get('max_size', default_max_size))
+        options = _split_options(data)
+    except (TypeError, ValueError) as e:
+        return {"error": str(e)}, 400
+    
+    start = time.perf_counter()
+    try:
+        analysis = analyze_pdf(path, max_size, profile=options['profile'], strategy=options['strategy'])
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except Exception:
+        logger.warning("Could not analyze %s", path, exc_info=True)
+        return {"error": "No se pudo leer el PDF"}, 400
+    analysis.update(max_size=max_size, elapsed_ms=round((time.perf_counter() - start) * 1000, 1))
+    return analysis, 200
+
+@app.route('/analyze', methods=['POST'])
+@_admitted
+def analyze():
+    """
+    Page count, estimated bytes per page and predicted parts for max_size,
+    without splitting: for a PDF sent as pdf_file, or for a job that was
+    uploaded and not processed yet (job_id), e.g. to try several limits.
+    """
+    try:
+        body, status = _analyze_request(request.get_json(silent=True) or request.form,
+                                        request.files.get('pdf_file'))
+    finally:
+        _discard_spools()
+    return jsonify(body), status
+
+@app.route('/jobs/<job_id>/parts')
+def job_parts(job_id):
+    """Parts ready for download; while the job runs, the ones finished so far."""
+    job = store.get(job_id)
+    if not job:
+        return jsonify({"error": "Job no encontrado"}), 404
+    
+    _, parts = _job_parts(job_id, job)
+    return jsonify({
+        'status': job['status'],
+        'complete': job['status'] == 'completed',
+        'parts': [{
+            'n': n,
+            'name': part['name'],
+            'size': part['size'],
+            'sha256': part.get('sha256'),
+            'first_page': part.get('first_page'),
+            'last_page': part.get('last_page'),
+            'url': f"/jobs/{job_id}/parts/{n}",
+        } for n, part in enumerate(parts, 1)],
+    })
+
+def _part_file(job_id, n):
+    """(path, manifest entry) of part n of a job, or None if it is not available."""
+    job = store.get(job_id)
+    if not job:
+        return None
+    parts_dir, parts = _job_parts(job_id, job)
+    if not 1 <= n <= len(parts):
+        return None
+    part = parts[n - 1]
+    path = os.path.join(parts_dir, part['file'])
+    if not os.path.exists(path):
+        return None
+    store.touch(job_id)
+    return os.path.abspath(path), part
+
+@app.route('/jobs/<job_id>/parts/<int:n>')
+def job_part(job_id, n):
+    found = _part_file(job_id, n)
+    if found is None:
+        return jsonify({"error": "Parte no disponible"}), 404
+    path, part = found
+    # send_file answers Range and If-None-Match / If-Range itself, and lets
+    # the server use sendfile() for the body
+    return send_file(path, mimetype='application/pdf', as_attachment=True,
+                     download_name=part['name'], conditional=True,
+                     etag=part.get('sha256', True))
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """
+    Cancel a job. A queued job is dropped at once; a running one is asked to
+    stop and does so at its next page or part (202). Any other job is
+    deleted together with its upload and results.
+    """
+    job = store.get(job_id)
+    if not job:
+        return jsonify({"error": "Job no encontrado"}), 404
+    
+    if job['status'] in ('queued', 'processing'):
+        if scheduler.cancel(job_id):
+            # Never started, so nothing else is using its files
+            _remove_input(job['filepath'])
+            scratch.release_hold(job_id)
+            _update_job(job_id, status='cancelled', filepath=None)
+            return jsonify({"status": "cancelled"})
+        # Running here or queued on another worker: it checks this flag
+        _update_job(job_id, cancel_requested=True)
+        return jsonify({"status": "cancelling"}), 202
+    
+    store.delete(job_id)
+    scratch.release_hold(job_id)
+    with progress_changed:
+        progress_changed.notify_all()
+    return jsonify({"status": "deleted"})
 
-    thread = threading.Thread(target=run_split)
-    thread.start()
-    return jsonify({"status": "started"})
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(cache.stats())
+
+@app.route('/scratch/stats')
+def scratch_stats():
+    """Disk used under UPLOAD_FOLDER by area, against the quota and the disk itself."""
+    return jsonify(scratch.stats())
+
+def _timed(name, chunks):
+    """Yield from chunks, recording the whole transfer as one span."""
+    with metrics.span(name):
+        yield from chunks
+
+def _job_archive(job_id):
+    """
+    (archive, etag, download name) of a completed job's ZIP, or None if the
+    result is not ready or has expired.
+    """
+    job = store.get(job_id)
+    if (not job or job['status'] != 'completed' or not job['result_path']
+            or not os.path.exists(job['result_path'])):
+        return None
+    
+    store.touch(job_id)
+    with metrics.span('zip_build'):
+        parts_dir, parts = _job_parts(job_id, job)
+        archive = StoredZip([(part['name'], os.path.join(parts_dir, part['file']),
+                              part['size'], part['crc32']) for part in parts])
+    base_name = os.path.splitext(job['filename'])[0]
+    return archive, f"{job_id}-{archive.size}", f"{base_name}_dividido.zip"
+
+def _requested_range(range_header, if_range_header, etag, length):
+    """
+    (start, stop, status) to send for the Range / If-Range headers of a
+    request: a single byte range is honoured (resume) while If-Range still
+    matches etag, anything else gets the whole body. None if the range
+    cannot be satisfied (416).
+    """
+    byte_range = parse_range_header(range_header)
+    if byte_range and len(byte_range.ranges) == 1:
+        if_range = parse_if_range_header(if_range_header)
+        if (if_range.etag is None and if_range.date is None) or if_range.etag == etag:
+            bounds = byte_range.range_for_length(length)
+            if bounds is None:
+                return None
+            return bounds[0], bounds[1], 206
+    return 0, length, 200
 
 @app.route('/download/<job_id>')
 def download(job_id):
-    job = jobs.get(job_id)
-    if not job or job['status'] != 'completed' or not job['result']:
+    found = _job_archive(job_id)
+    if found is None:
         return "Archivo no listo o expirado", 404
+    archive, etag, download_name = found
     
-    base_name = os.path.splitext(job['filename'])[0]
-    return send_file(
-        io.BytesIO(job['result']),
-        mimetype='application/zip',
-        as_attachment=True,
-        download_name=f"{base_name}_dividido.zip"
-    )
+    requested = _requested_range(request.headers.get('Range'), request.headers.get('If-Range'),
+                                 etag, archive.size)
+    if requested is None:
+        response = Response(status=416)
+        response.content_range = ContentRange('bytes', None, None, archive.size)
+        return response
+    start, stop, status = requested
+    
+    response = Response(_timed('download', archive.iter_range(start, stop)), status=status,
+                        mimetype='application/zip', direct_passthrough=True)
+    response.content_length = stop - start
+    response.accept_ranges = 'bytes'
+    if status == 206:
+        response.content_range = ContentRange('bytes', start, stop, archive.size)
+    response.set_etag(etag)
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return response
+
+def _recover_jobs():
+    """
+    Fail the jobs a dead worker left queued or processing, and remove their
+    files. Its process is gone, or (the pid may have been reused) a job it
+    was running has been silent for longer than JOB_TIMEOUT allows.
+    """
+    now = time.time()
+    for job_id, job in store.jobs(('queued', 'processing')):
+        idle = now - job['updated']
+        if scheduler.position(job_id) is not None or idle < app.config['SWEEP_INTERVAL']:
+            continue  # queued or running here, or just handed to the scheduler
+        owner = job.get('owner')
+        if not (owner == os.getpid() or (owner and not process_alive(owner))
+                or (job['status'] == 'processing' and idle > 2 * app.config['JOB_TIMEOUT'])
+                or idle > app.config['JOB_TTL']):
+            continue
+        logger.warning("Job %s was left %s by a stopped worker", job_id, job['status'])
+        _update_job(job_id, status='error', filepath=None,
+                    error_msg="El servidor se reinició durante el procesamiento")
+        shutil.rmtree(scratch.job_path(job_id), ignore_errors=True)
+        scratch.release_hold(job_id)
+
+def _sweep():
+    """
+    Expire old jobs and uploads, recover abandoned jobs, release the space
+    held for jobs that are gone, then remove orphaned files.
+    """
+    store.evict()
+    _evict_uploads()
+    _recover_jobs()
+    _release_holds()
+    scratch.sweep(lambda job_id: store.get(job_id) is not None)
+
+def _sweeper():
+    # The first sweep runs at startup and cleans up after a crashed worker
+    while True:
+        try:
+            _sweep()
+        except Exception:
+            logger.exception("Scratch sweep failed")
+        time.sleep(app.config['SWEEP_INTERVAL'])
+
+_started = False
+_started_lock = threading.Lock()
+
+def start_background():
+    """
+    Start the split workers and the scratch sweeper, whose first sweep
+    recovers what a stopped worker left behind. Runs once per process,
+    before the first request (or from asgi's lifespan), so importing this
+    module, as spawned pool processes may, starts nothing.
+    """
+    global _started
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+    scheduler.start()
+    threading.Thread(target=_sweeper, name="scratch-sweeper", daemon=True).start()
+
+@app.before_request
+def _start_background_once():
+    start_background()
 
 if __name__ == '__main__':
+    start_background()
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port, threaded=True)
@@ -47,74 +47,179 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // Comprehensive Job Management
-    async function manageJob(formData) {
+    async function manageJob(file, maxSize) {
         // 1. Upload Phase
-        const jobId = await uploadFile(formData);
+        const jobId = await uploadFile(file, maxSize);
         if (!jobId) return;
 
-        // 2. Start Polling for Progress
-        const pollInterval = setInterval(async () => {
-            try {
-                const response = await fetch(`/progress/${jobId}`);
-                const data = await response.json();
-
-                if (data.status === 'processing') {
-                    progressBarFill.style.width = data.progress + '%';
-                    progressText.innerText = `Dividiendo PDF... ${data.progress}%`;
-                    btnText.innerText = 'Dividiendo...';
-                } else if (data.status === 'completed') {
-                    clearInterval(pollInterval);
-                    showStatus('¡Procesado completo! Iniciando descarga...', 'success');
-                    progressContainer.classList.add('hidden');
-                    triggerDownload(jobId);
-                    resetUI();
-                } else if (data.status === 'error') {
-                    clearInterval(pollInterval);
-                    showStatus('Error: ' + data.error, 'error');
-                    progressContainer.classList.add('hidden');
-                    resetUI();
-                }
-            } catch (e) {
-                console.error("Error polling progress:", e);
+        // 2. Follow progress: pushed over Server-Sent Events, with
+        // 1-second polling as a fallback when the stream is unavailable
+        let finished = false;
+        let eventSource = null;
+        let pollInterval = null;
+
+        function stopWatching() {
+            finished = true;
+            if (eventSource) eventSource.close();
+            if (pollInterval) clearInterval(pollInterval);
+            window.removeEventListener('pagehide', cancelJob);
+        }
+
+        // Leaving the page cancels the job so it stops using the server
+        function cancelJob() {
+            if (!finished) fetch(`/jobs/${jobId}`, { method: 'DELETE', keepalive: true });
+        }
+        window.addEventListener('pagehide', cancelJob);
+
+        function phaseText(data) {
+            if (data.phase === 'parse') return 'Analizando páginas...';
+            if (data.phase === 'plan') return 'Planificando partes...';
+            if (data.phase === 'archive') return 'Preparando la descarga...';
+            if (data.phase === 'serialize' && data.parts) {
+                const speed = data.throughput ? ` a ${(data.throughput / 1048576).toFixed(1)} MB/s` : '';
+                return `Generando parte ${data.part} de ${data.parts}${speed}...`;
             }
-        }, 1000);
+            return 'Dividiendo PDF...';
+        }
+
+        function handleProgress(data) {
+            if (finished) return;
+            if (data.status === 'queued') {
+                const eta = data.eta !== null ? ` (~${Math.ceil(data.eta)} s)` : '';
+                progressText.innerText = `En cola, posición ${data.queue_position}${eta}`;
+                btnText.innerText = 'En cola...';
+            } else if (data.status === 'processing') {
+                progressBarFill.style.width = data.progress + '%';
+                progressText.innerText = `${phaseText(data)} ${data.progress}%`;
+                btnText.innerText = 'Dividiendo...';
+            } else if (data.status === 'completed') {
+                stopWatching();
+                const pages = (data.recompressed || []).map(r => r.page);
+                const note = pages.length ? ` Imágenes recomprimidas en las páginas ${pages.join(', ')}.` : '';
+                showStatus('¡Procesado completo! Iniciando descarga...' + note, 'success');
+                progressContainer.classList.add('hidden');
+                triggerDownload(jobId);
+                resetUI();
+            } else if (data.status === 'cancelled') {
+                stopWatching();
+                showStatus('División cancelada', 'error');
+                progressContainer.classList.add('hidden');
+                resetUI();
+            } else if (data.status === 'error') {
+                stopWatching();
+                showStatus('Error: ' + data.error, 'error');
+                progressContainer.classList.add('hidden');
+                resetUI();
+            }
+        }
+
+        function startPolling() {
+            pollInterval = setInterval(async () => {
+                try {
+                    const response = await fetch(`/progress/${jobId}`);
+                    handleProgress(await response.json());
+                } catch (e) {
+                    console.error("Error polling progress:", e);
+                }
+            }, 1000);
+        }
+
+        if (window.EventSource) {
+            eventSource = new EventSource(`/progress/${jobId}/stream`);
+            eventSource.onmessage = (e) => handleProgress(JSON.parse(e.data));
+            eventSource.onerror = () => {
+                eventSource.close();
+                eventSource = null;
+                if (!finished) startPolling();
+            };
+        } else {
+            startPolling();
+        }
 
         // 3. Trigger Processing
-        await fetch(`/process/${jobId}`, { method: 'POST' });
+        const response = await fetch(`/process/${jobId}`, { method: 'POST' });
+        if (response.status === 429) {
+            stopWatching();
+            showStatus('El servidor está ocupado. Inténtalo de nuevo en unos segundos.', 'error');
+            progressContainer.classList.add('hidden');
+            resetUI();
+        }
     }
 
-    function uploadFile(formData) {
-        return new Promise((resolve) => {
-            const xhr = new XMLHttpRequest();
+    // Resumable upload: the file is sent in slices, a few at a time, and
+    // each slice is retried on its own if the connection drops
+    const UPLOAD_CONCURRENCY = 3;
+    const UPLOAD_RETRIES = 3;
 
-            xhr.upload.addEventListener('progress', (e) => {
-                if (e.lengthComputable) {
-                    const percent = Math.round((e.loaded / e.total) * 100);
-                    progressBarFill.style.width = percent + '%';
-                    progressText.innerText = `Subiendo archivo... ${percent}%`;
-                }
+    async function uploadFile(file, maxSize) {
+        try {
+            const initResponse = await fetch('/upload/init', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    filename: file.name,
+                    size: file.size,
+                    max_size: maxSize,
+                    profile: document.getElementById('profile').value,
+                    recompress: document.getElementById('recompress').checked,
+                    strategy: document.getElementById('strategy').value
+                })
             });
+            const init = await initResponse.json();
+            if (!initResponse.ok) {
+                throw new Error(init.error || 'Error al subir el archivo');
+            }
+
+            const offsets = [];
+            for (let offset = 0; offset < file.size; offset += init.chunk_size) {
+                offsets.push(offset);
+            }
 
-            xhr.onload = () => {
-                if (xhr.status === 200) {
-                    const data = JSON.parse(xhr.responseText);
-                    resolve(data.job_id);
-                } else {
-                    showStatus('Error al subir el archivo', 'error');
-                    resetUI();
-                    resolve(null);
+            let uploaded = 0;
+            async function sendChunk(offset) {
+                const chunk = file.slice(offset, offset + init.chunk_size);
+                for (let attempt = 1; ; attempt++) {
+                    try {
+                        const response = await fetch(`/upload/${init.upload_id}`, {
+                            method: 'PATCH',
+                            headers: {
+                                'Content-Type': 'application/octet-stream',
+                                'Upload-Offset': String(offset)
+                            },
+                            body: chunk
+                        });
+                        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                        break;
+                    } catch (e) {
+                        if (attempt >= UPLOAD_RETRIES) throw e;
+                        await new Promise(r => setTimeout(r, 1000 * attempt));
+                    }
                 }
-            };
+                uploaded += chunk.size;
+                const percent = Math.round((uploaded / file.size) * 100);
+                progressBarFill.style.width = percent + '%';
+                progressText.innerText = `Subiendo archivo... ${percent}%`;
+            }
 
-            xhr.onerror = () => {
-                showStatus('Error de red al subir', 'error');
-                resetUI();
-                resolve(null);
-            };
+            async function worker() {
+                while (offsets.length) {
+                    await sendChunk(offsets.shift());
+                }
+            }
+            await Promise.all(Array.from({ length: UPLOAD_CONCURRENCY }, worker));
 
-            xhr.open('POST', '/upload');
-            xhr.send(formData);
-        });
+            const completeResponse = await fetch(`/upload/${init.upload_id}/complete`, { method: 'POST' });
+            const data = await completeResponse.json();
+            if (!completeResponse.ok) {
+                throw new Error(data.error || 'Error al subir el archivo');
+            }
+            return data.job_id;
+        } catch (e) {
+            showStatus(e.message === 'Failed to fetch' ? 'Error de red al subir' : e.message, 'error');
+            progressContainer.classList.add('hidden');
+            resetUI();
+            return null;
+        }
     }
 
     function triggerDownload(jobId) {
@@ -140,7 +245,7 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
-        const formData = new FormData(uploadForm);
+        const maxSize = document.getElementById('max_size').value;
 
         submitBtn.disabled = true;
         loader.style.display = 'block';
@@ -148,7 +253,7 @@ document.addEventListener('DOMContentLoaded', () => {
         statusMsg.classList.add('hidden');
         progressContainer.classList.remove('hidden');
 
-        manageJob(formData);
+        manageJob(fileInput.files[0], maxSize);
     });
 
     function showStatus(msg, type) {
@@ -0,0 +1,130 @@
+import io
+import os
+import random
+import hashlib
+import shutil
+import tempfile
+import threading
+import unittest
+
+from chunked_upload import ChunkedUpload
+
+CHUNK = 1000
+
+
+class ChunkedUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data = os.urandom(10 * CHUNK + 123)
+        self.upload = ChunkedUpload(os.path.join(self.tmp, 'incoming'), len(self.data),
+                                    'documento.pdf', 4.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _send(self, offset, length=CHUNK):
+        return self.upload.write(offset, io.BytesIO(self.data[offset:offset + length]))
+
+    def _assert_complete(self):
+        self.assertTrue(self.upload.is_complete())
+        self.assertEqual(self.upload.received(), [[0, len(self.data)]])
+        self.assertEqual(self.upload.received_bytes(), len(self.data))
+        self.assertEqual(self.upload.sha256(), hashlib.sha256(self.data).hexdigest())
+        with open(self.upload.path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_out_of_order_chunks(self):
+        offsets = list(range(0, len(self.data), CHUNK))
+        random.Random(1).shuffle(offsets)
+        offsets.remove(0)
+        for offset in offsets:
+            self._send(offset)
+        # Nothing can be hashed before the first chunk lands
+        self.assertFalse(self.upload.is_complete())
+        self.assertEqual(self.upload.received(), [[CHUNK, len(self.data)]])
+        self.assertEqual(self.upload.sha256(), hashlib.sha256().hexdigest())
+
+        self._send(0)
+        self._assert_complete()
+
+    def test_gaps_are_reported(self):
+        self._send(0)
+        self._send(3 * CHUNK)
+        self._send(5 * CHUNK, 2 * CHUNK)
+        self.assertFalse(self.upload.is_complete())
+        self.assertEqual(self.upload.received(),
+                         [[0, CHUNK], [3 * CHUNK, 4 * CHUNK], [5 * CHUNK, 7 * CHUNK]])
+        self.assertEqual(self.upload.received_bytes(), 4 * CHUNK)
+
+    def test_duplicate_and_overlapping_chunks(self):
+        for offset in range(0, len(self.data), CHUNK):
+            self._send(offset)
+            # A retry of a chunk that did arrive
+            self._send(offset)
+        # Overlapping the end of one chunk and the start of the next
+        self._send(CHUNK // 2)
+        self._assert_complete()
+
+    def test_received_bytes_are_not_overwritten(self):
+        for offset in range(0, len(self.data), CHUNK):
+            self._send(offset)
+        forged = os.urandom(CHUNK)
+        # Read in full, written nowhere
+        self.assertEqual(self.upload.write(0, io.BytesIO(forged)), CHUNK)
+        self._assert_complete()
+
+    def test_overlapping_chunk_only_fills_the_gap(self):
+        self._send(0)
+        self._send(2 * CHUNK)
+        forged = os.urandom(3 * CHUNK)
+        self.upload.write(0, io.BytesIO(forged))
+        with open(self.upload.path, 'rb') as f:
+            start = f.read(3 * CHUNK)
+        self.assertEqual(start, self.data[:CHUNK] + forged[CHUNK:2 * CHUNK] + self.data[2 * CHUNK:3 * CHUNK])
+        self.assertEqual(self.upload.received(), [[0, 3 * CHUNK]])
+
+        # Whatever was written first is what the digest covers
+        self.data = start + self.data[3 * CHUNK:]
+        for offset in range(3 * CHUNK, len(self.data), CHUNK):
+            self._send(offset)
+        self._assert_complete()
+
+    def test_writes_after_finish_are_refused(self):
+        self._send(0)
+        self.assertIsNone(self.upload.finish())
+        for offset in range(CHUNK, len(self.data), CHUNK):
+            self._send(offset)
+        self.assertEqual(self.upload.finish(), hashlib.sha256(self.data).hexdigest())
+
+        with self.assertRaises(ValueError):
+            self.upload.write(0, io.BytesIO(os.urandom(CHUNK)))
+        with self.assertRaises(ValueError):
+            self._send(CHUNK)
+        self._assert_complete()
+
+    def test_concurrent_chunks(self):
+        offsets = list(range(0, len(self.data), CHUNK))
+        random.Random(2).shuffle(offsets)
+        threads = [threading.Thread(target=self._send, args=(offset,)) for offset in offsets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._assert_complete()
+
+    def test_chunk_past_the_declared_size(self):
+        with self.assertRaises(ValueError):
+            self.upload.write(len(self.data) - 10, io.BytesIO(bytes(20)))
+        with self.assertRaises(ValueError):
+            self.upload.write(len(self.data) + 1, io.BytesIO(b'x'))
+        with self.assertRaises(ValueError):
+            self.upload.write(-1, io.BytesIO(b'x'))
+
+    def test_discard(self):
+        self.upload.discard()
+        self.assertFalse(os.path.exists(self.upload.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
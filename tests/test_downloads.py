@@ -0,0 +1,189 @@
+import io
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import fitz
+
+server = None
+_cwd = None
+_tmp = None
+_job_id = None
+
+
+def setUpModule():
+    # UPLOAD_FOLDER is relative to the working directory at import time
+    global server, _cwd, _tmp, _job_id
+    _cwd = os.getcwd()
+    _tmp = tempfile.mkdtemp()
+    os.chdir(_tmp)
+    import server
+    _job_id = _split(_sample_pdf(), 'muestra.pdf', 0.01)
+
+
+def tearDownModule():
+    os.chdir(_cwd)
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+def _sample_pdf(pages=40):
+    doc = fitz.open()
+    for n in range(pages):
+        doc.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), f"Página {n + 1}\n\n" + "texto " * 600)
+    data = doc.tobytes(garbage=1, deflate=True)
+    doc.close()
+    return data
+
+
+def _split(data, filename, max_size):
+    """Upload and split a PDF through the API; returns the completed job's id."""
+    client = server.app.test_client()
+    response = client.post('/upload', data={'pdf_file': (io.BytesIO(data), filename),
+                                            'max_size': str(max_size)},
+                           content_type='multipart/form-data')
+    job_id = response.get_json()['job_id']
+    client.post(f'/process/{job_id}')
+    deadline = time.time() + 60
+    while server.store.get(job_id)['status'] not in server._FINAL_STATUSES:
+        if time.time() > deadline:
+            raise AssertionError("the split did not finish")
+        time.sleep(0.1)
+    assert server.store.get(job_id)['status'] == 'completed'
+    return job_id
+
+
+class _ClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = server.app.test_client()
+        cls.job_id = _job_id
+
+    def _get(self, url, headers=None):
+        response = self.client.get(url, headers=headers or {})
+        response.get_data()
+        response.close()
+        return response
+
+
+class ArchiveDownloadTest(_ClientTest):
+    """Range and If-Range requests on /download/<job_id>."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        response = cls.client.get(f'/download/{cls.job_id}')
+        cls.archive = response.get_data()
+        cls.etag = response.headers['ETag'].strip('"')
+        response.close()
+
+    def _download(self, headers=None):
+        return self._get(f'/download/{self.job_id}', headers)
+
+    def test_whole_archive(self):
+        response = self._download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(int(response.headers['Content-Length']), len(self.archive))
+        with zipfile.ZipFile(io.BytesIO(self.archive)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertTrue(all(name.startswith('muestra_parte_') for name in zf.namelist()))
+
+    def test_byte_range(self):
+        response = self._download({'Range': 'bytes=10-1009'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], f"bytes 10-1009/{len(self.archive)}")
+        self.assertEqual(response.data, self.archive[10:1010])
+
+    def test_open_and_suffix_ranges(self):
+        start = len(self.archive) - 300
+        response = self._download({'Range': f'bytes={start}-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, self.archive[start:])
+
+        response = self._download({'Range': 'bytes=-50'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, self.archive[-50:])
+
+    def test_resuming_gives_the_same_bytes(self):
+        cut = len(self.archive) // 3
+        head = self._download({'Range': f'bytes=0-{cut - 1}'}).data
+        tail = self._download({'Range': f'bytes={cut}-', 'If-Range': f'"{self.etag}"'}).data
+        self.assertEqual(head + tail, self.archive)
+
+    def test_stale_if_range_gets_the_whole_archive(self):
+        response = self._download({'Range': 'bytes=100-199', 'If-Range': '"otro"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.archive)
+
+    def test_several_ranges_get_the_whole_archive(self):
+        response = self._download({'Range': 'bytes=0-9,20-29'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.archive)
+
+    def test_unsatisfiable_range(self):
+        response = self._download({'Range': f'bytes={len(self.archive)}-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], f"bytes */{len(self.archive)}")
+
+
+class PartDownloadTest(_ClientTest):
+    """/jobs/<job_id>/parts and the download of each part."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.parts = cls.client.get(f'/jobs/{cls.job_id}/parts').get_json()['parts']
+
+    def test_listing(self):
+        listing = self.client.get(f'/jobs/{self.job_id}/parts').get_json()
+        self.assertTrue(listing['complete'])
+        self.assertGreater(len(self.parts), 1)
+        self.assertEqual([part['n'] for part in self.parts], list(range(1, len(self.parts) + 1)))
+        self.assertTrue(all(part['name'].startswith('muestra_parte_') for part in self.parts))
+        self.assertEqual(self.parts[0]['first_page'], 1)
+        for before, after in zip(self.parts, self.parts[1:]):
+            self.assertEqual(after['first_page'], before['last_page'] + 1)
+
+    def test_parts_make_up_the_archive(self):
+        response = self._get(f'/download/{self.job_id}')
+        with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+            self.assertEqual(zf.namelist(), [part['name'] for part in self.parts])
+            for part in self.parts:
+                self.assertEqual(zf.read(part['name']), self._get(part['url']).data)
+
+    def test_part_ranges(self):
+        part = self.parts[0]
+        url = f"/jobs/{self.job_id}/parts/{part['n']}"
+        whole = self._get(url)
+        self.assertEqual(whole.status_code, 200)
+        self.assertEqual(len(whole.data), part['size'])
+        self.assertTrue(whole.data.startswith(b'%PDF'))
+
+        response = self._get(url, {'Range': 'bytes=100-599'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], f"bytes 100-599/{part['size']}")
+        self.assertEqual(response.data, whole.data[100:600])
+
+        response = self._get(url, {'Range': 'bytes=100-599', 'If-Range': f"\"{part['sha256']}\""})
+        self.assertEqual(response.status_code, 206)
+        response = self._get(url, {'Range': 'bytes=100-599', 'If-Range': '"otro"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, whole.data)
+
+        response = self._get(url, {'If-None-Match': f"\"{part['sha256']}\""})
+        self.assertEqual(response.status_code, 304)
+
+        response = self._get(url, {'Range': f"bytes={part['size']}-"})
+        self.assertEqual(response.status_code, 416)
+
+    def test_missing_part(self):
+        response = self._get(f"/jobs/{self.job_id}/parts/{len(self.parts) + 1}")
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import benchmark
+import pdf_logic
+from pdf_logic import analyze_pdf, parse_max_size, parse_strategy, split_pdf
+
+
+class CarryOverTest(unittest.TestCase):
+    """A part over the limit passes its extra pages on to the next part instead of a sliver."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmp, 'text.pdf')
+        benchmark.make_text(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_overflowing_part_carries_into_the_next(self):
+        # The first planned part (pages 1-222) serializes over 0.2 MB
+        max_size_mb = 0.2
+        limit = max_size_mb * 1024 * 1024
+        stats = {}
+        sizes = [len(content) for _, content in split_pdf(self.path, max_size_mb, stats=stats)]
+
+        self.assertEqual(len(sizes), 2)
+        self.assertLessEqual(max(sizes), limit)
+        self.assertGreater(min(sizes) / limit, 0.5)
+        self.assertEqual(stats['pages'][-1][1], 400)
+
+    def test_analyze_matches_split(self):
+        stats = {}
+        split_pdf(self.path, 0.2, stats=stats)
+        predicted = [(part['first_page'], part['last_page'])
+                     for part in analyze_pdf(self.path, 0.2)['parts']]
+        self.assertEqual(predicted, stats['pages'])
+
+    def test_out_of_order_ranges(self):
+        # Each segment overflows on its first part; the carry stays within it
+        strategy = 'ranges:201-400,1-200+size'
+        expected = list(range(201, 401)) + list(range(1, 201))
+        for workers in (None, 3):
+            with self.subTest(workers=workers), mock.patch.object(pdf_logic, '_PARALLEL_MIN_PAGES', 1):
+                stats = {}
+                split_pdf(self.path, 0.1, stats=stats, strategy=strategy, workers=workers)
+                pages = [page for first, last in stats['pages'] for page in range(first, last + 1)]
+                self.assertEqual(pages, expected)
+
+        parts = analyze_pdf(self.path, 0.1, strategy=strategy)['parts']
+        pages = [page for part in parts for page in range(part['first_page'], part['last_page'] + 1)]
+        self.assertEqual(pages, expected)
+
+
+class MaxSizeTest(unittest.TestCase):
+
+    def test_valid_sizes(self):
+        self.assertEqual(parse_max_size('2.5'), 2.5)
+        self.assertEqual(parse_max_size(4), 4.0)
+
+    def test_invalid_sizes(self):
+        for value in (-1, 0, '0', 'abc', None, 'nan', float('inf')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_max_size(value)
+        for strategy in ('size:0', 'size:-1', 'size:nan', 'bookmarks+size:inf'):
+            with self.subTest(strategy=strategy), self.assertRaises(ValueError):
+                parse_strategy(strategy)
+
+    def test_split_rejects_invalid_size(self):
+        with self.assertRaises(ValueError):
+            split_pdf(io.BytesIO(), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+import zlib
+
+from zipstream import StoredZip
+
+
+class _ArchiveReader(io.RawIOBase):
+    """A seekable file over a StoredZip that reads through iter_range() only."""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.archive.size}[whence]
+        self.position = base + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        stop = min(self.position + len(buffer), self.archive.size)
+        data = b''.join(self.archive.iter_range(self.position, stop))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class StoredZipTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _file(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def _entries(self):
+        contents = {'parte_001.pdf': os.urandom(3000), 'parte_002.pdf': b'',
+                    'informe_año_003.pdf': os.urandom(70000)}
+        return contents, [(name, self._file(f"{n}.pdf", content), len(content), zlib.crc32(content))
+                          for n, (name, content) in enumerate(contents.items())]
+
+    def test_zipfile_reads_the_archive(self):
+        contents, entries = self._entries()
+        archive = StoredZip(entries)
+        data = b''.join(archive.iter_range())
+        self.assertEqual(len(data), archive.size)
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist(), list(contents))
+            for name, content in contents.items():
+                self.assertEqual(zf.getinfo(name).compress_type, zipfile.ZIP_STORED)
+                self.assertEqual(zf.read(name), content)
+        # Small archives keep the classic format
+        self.assertNotIn(b'PK\x06\x06', data)
+
+    def test_ranges_match_the_whole_archive(self):
+        _, entries = self._entries()
+        archive = StoredZip(entries)
+        data = b''.join(archive.iter_range())
+        # Boundaries inside headers, inside entries, across entries and at the ends
+        cuts = [0, 1, 29, 30, 31, 100, 3040, 3100, 3200, 50000, archive.size - 22,
+                archive.size - 1, archive.size]
+        for start in cuts:
+            for stop in cuts:
+                if start <= stop:
+                    self.assertEqual(b''.join(archive.iter_range(start, stop)), data[start:stop],
+                                     (start, stop))
+
+    def test_zip64_for_entries_past_4_gib(self):
+        # Sparse: takes no disk space, and only the ranges zipfile asks for are read
+        big = os.path.join(self.tmp, 'big.pdf')
+        big_size = 0x100000000 + 10
+        with open(big, 'wb') as f:
+            f.truncate(big_size)
+        small = os.urandom(500)
+        archive = StoredZip([('grande.pdf', big, big_size, 0),
+                             ('pequeño.pdf', self._file('small.pdf', small), len(small), zlib.crc32(small))])
+        self.assertGreater(archive.size, big_size)
+
+        with zipfile.ZipFile(_ArchiveReader(archive)) as zf:
+            self.assertEqual(zf.getinfo('grande.pdf').file_size, big_size)
+            self.assertGreater(zf.getinfo('pequeño.pdf').header_offset, 0xFFFFFFFF)
+            self.assertEqual(zf.read('pequeño.pdf'), small)
+            with zf.open('grande.pdf') as member:
+                self.assertEqual(member.read(4096), bytes(4096))
+
+    def test_zip64_for_65535_entries_or_more(self):
+        content = b'%PDF-1.7\n'
+        path = self._file('part.pdf', content)
+        count = 0xFFFF + 10
+        archive = StoredZip([(f"parte_{n:05d}.pdf", path, len(content), zlib.crc32(content))
+                             for n in range(count)])
+
+        with zipfile.ZipFile(_ArchiveReader(archive)) as zf:
+            names = zf.namelist()
+            self.assertEqual(len(names), count)
+            self.assertEqual(zf.read(names[-1]), content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import struct
+
+# Fixed DOS timestamp (1980-01-01 00:00) so the archive bytes, and with them
+# Content-Length, ETag and byte ranges, are stable across requests
+_DOS_TIME = 0
+_DOS_DATE = (0 << 9) | (1 << 5) | 1
+# Bit 11: file names are UTF-8
+_FLAGS = 0x0800
+_VERSION = 20
+_VERSION_ZIP64 = 45
+# Largest values the classic records hold; beyond them ZIP64 records are used
+_MAX_32 = 0xFFFFFFFF
+_MAX_16 = 0xFFFF
+_READ_SIZE = 64 * 1024
+
+
+class StoredZip:
+    """
+    Byte layout of a ZIP archive of STORED (uncompressed) entries built from
+    files already on disk. PDF parts barely compress, so storing them lets
+    the total size be known up front and any byte range be produced on the
+    fly, without building the archive anywhere.
+
+    Entries of 4 GiB or more, entries past the first 4 GiB and archives of
+    65535 entries or more get ZIP64 records; anything smaller is written in
+    the classic format.
+
+    entries: list of (arcname, path, size, crc32).
+    """
+
+    def __init__(self, entries):
+        self._segments = []  # (offset, length, bytes or (path, file_offset))
+        central = []
+        offset = 0
+
+        for arcname, path, size, crc in entries:
+            name = arcname.encode('utf-8')
+            large = size >= _MAX_32
+            far = offset >= _MAX_32
+            version = _VERSION_ZIP64 if large or far else _VERSION
+            stored_size = _MAX_32 if large else size
+
+            # The ZIP64 extra field holds the values that did not fit
+            local_extra = struct.pack('<HHQQ', 0x0001, 16, size, size) if large else b''
+            local_header = struct.pack(
+                '<IHHHHHIIIHH', 0x04034b50, version, _FLAGS, 0, _DOS_TIME, _DOS_DATE,
+                crc, stored_size, stored_size, len(name), len(local_extra)) + name + local_extra
+            wide = ([size, size] if large else []) + ([offset] if far else [])
+            central_extra = (struct.pack(f'<HH{len(wide)}Q', 0x0001, 8 * len(wide), *wide)
+                             if wide else b'')
+            central.append(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, version, version, _FLAGS, 0,
+                _DOS_TIME, _DOS_DATE, crc, stored_size, stored_size, len(name),
+                len(central_extra), 0, 0, 0, 0, min(offset, _MAX_32)) + name + central_extra)
+
+            self._add(offset, local_header)
+            offset += len(local_header)
+            self._segments.append((offset, size, path))
+            offset += size
+
+        central_dir = b''.join(central)
+        count = len(entries)
+        end_records = b''
+        if count >= _MAX_16 or len(central_dir) >= _MAX_32 or offset >= _MAX_32:
+            # ZIP64 end of central directory record and its locator
+            end_records = struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, _VERSION_ZIP64, _VERSION_ZIP64, 0, 0,
+                count, count, len(central_dir), offset)
+            end_records += struct.pack('<IIQI', 0x07064b50, 0, offset + len(central_dir), 1)
+        end_records += struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, min(count, _MAX_16), min(count, _MAX_16),
+            min(len(central_dir), _MAX_32), min(offset, _MAX_32), 0)
+        self._add(offset, central_dir + end_records)
+        self.size = offset + len(central_dir) + len(end_records)
+
+    def _add(self, offset, data):
+        self._segments.append((offset, len(data), data))
+
+    def iter_range(self, start=0, stop=None):
+        """Yield the archive bytes in [start, stop)."""
+        if stop is None:
+            stop = self.size
+        for seg_offset, length, source in self._segments:
+            seg_end = seg_offset + length
+            if seg_end <= start or seg_offset >= stop or length == 0:
+                continue
+            lo = max(start, seg_offset) - seg_offset
+            hi = min(stop, seg_end) - seg_offset
+            if isinstance(source, bytes):
+                yield source[lo:hi]
+                continue
+            with open(source, 'rb') as f:
+                f.seek(lo)
+                remaining = hi - lo
+                while remaining:
+                    data = f.read(min(remaining, _READ_SIZE))
+                    if not data:
+                        raise IOError(f"{source} truncado")
+                    remaining -= len(data)
+                    yield data